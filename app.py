@@ -1,60 +1,180 @@
 # screen_recorder.py (Headless Version)
-import cv2
-import numpy as np
 import mss
 import time
+import queue
+import shutil
+import threading
+import subprocess
 
 # ==============================================================================
 #                             配置区域
 # ==============================================================================
-# 输出文件名 (AVI格式)
-OUTPUT_FILENAME = "recording_headless.avi"
+# 输出文件名 (MP4格式)
+OUTPUT_FILENAME = "recording_headless.mp4"
 
 # 录制的帧率 (FPS)
 FPS = 20.0
+
+# FFmpeg 可执行文件 (需在 PATH 中，或填写绝对路径)
+FFMPEG_BINARY = "ffmpeg"
+
+# NVENC 硬件编码参数: p1 为最快的预设, ll 为低延迟调优
+NVENC_PRESET = "p1"
+NVENC_BITRATE = "20M"
+
+# 找不到 FFmpeg 时回退到 OpenCV 的 XVID 编码 (AVI格式)
+FALLBACK_OUTPUT_FILENAME = "recording_headless.avi"
+
+# 采集线程与编码线程之间的帧队列长度，队列满时丢弃最旧的帧
+FRAME_QUEUE_SIZE = 4
 # ==============================================================================
 
+def start_encoder(width, height):
+    """启动 FFmpeg 子进程，通过 stdin 接收原始 BGRA 帧并使用 NVENC 在 GPU 上编码。"""
+    cmd = [
+        FFMPEG_BINARY, "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgra",
+        "-s", f"{width}x{height}",
+        "-r", str(FPS),
+        "-i", "-",
+        "-c:v", "h264_nvenc",
+        "-preset", NVENC_PRESET,
+        "-tune", "ll",
+        "-rc", "cbr",
+        "-b:v", NVENC_BITRATE,
+        OUTPUT_FILENAME,
+    ]
+    # bufsize=0: 帧数据直接写入管道，不再经过 Python 缓冲区的额外拷贝
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=0)
+
+def write_frame(pipe, buffer):
+    """将一帧原始数据完整写入无缓冲管道 (无缓冲写入可能只写入部分字节)。"""
+    view = memoryview(buffer)
+    while view:
+        written = pipe.write(view)
+        view = view[written:]
+
+def open_xvid_writer(width, height):
+    """
+    回退路径：用 OpenCV 的 XVID 编码写 AVI 文件，返回 (VideoWriter, 写帧函数)。
+    BGRA→BGR 转换在 OpenCL 可用时通过 cv2.UMat 交给 GPU 执行，否则在 CPU 上转换。
+    """
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(FALLBACK_OUTPUT_FILENAME, cv2.VideoWriter_fourcc(*'XVID'), FPS, (width, height))
+    use_opencl = cv2.ocl.haveOpenCL()
+    cv2.ocl.setUseOpenCL(use_opencl)
+    print(f"BGRA→BGR 转换: {'OpenCL (GPU)' if use_opencl else 'CPU'}")
+    # 目标缓冲区只分配一次，每帧复用
+    bgr = cv2.UMat(height, width, cv2.CV_8UC3) if use_opencl else np.empty((height, width, 3), dtype=np.uint8)
+
+    def write(frame):
+        bgra = np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 4)
+        if use_opencl:
+            bgra = cv2.UMat(bgra)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=bgr)
+        writer.write(bgr)
+
+    return writer, write
+
+def capture_frames(monitor, frame_queue, stop_event):
+    """采集线程：按设定帧率抓屏并放入队列，编码变慢时丢弃最旧的帧，采集永不阻塞。"""
+    interval = 1.0 / FPS
+    next_frame_time = time.perf_counter()
+    # mss 实例不能跨线程使用，因此在采集线程内部创建
+    with mss.mss() as sct:
+        while not stop_event.is_set():
+            # 每次抓取都会分配新的缓冲区，可以直接把它的所有权交给编码线程
+            frame = sct.grab(monitor).raw
+            try:
+                frame_queue.put_nowait(frame)
+            except queue.Full:
+                try:
+                    frame_queue.get_nowait()
+                except queue.Empty:
+                    pass
+                frame_queue.put_nowait(frame)
+
+            next_frame_time += interval
+            delay = next_frame_time - time.perf_counter()
+            if delay > 0:
+                stop_event.wait(delay)
+            else:
+                # 已经落后于目标帧率，从当前时间重新计时
+                next_frame_time = time.perf_counter()
+
+def encode_frames(write, frame_queue, stop_event):
+    """编码线程：从队列取出帧交给编码器写入，停止后会先写完队列中剩余的帧。"""
+    try:
+        while not (stop_event.is_set() and frame_queue.empty()):
+            try:
+                frame = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            write(frame)
+    except (BrokenPipeError, OSError) as e:
+        print(f"\n编码进程已退出，停止录制: {e}")
+        stop_event.set()
+
 def main():
     print("无头录屏程序已启动。")
-    print(f"输出文件: {OUTPUT_FILENAME}")
+    output_filename = OUTPUT_FILENAME if shutil.which(FFMPEG_BINARY) else FALLBACK_OUTPUT_FILENAME
+    print(f"输出文件: {output_filename}")
     print(f"录制帧率: {FPS}")
     print("\n将在3秒后开始录制... 您可以切换到需要录制的窗口。")
     time.sleep(3)
     print("录制开始！请在此窗口中按下 Ctrl+C 来停止录制。")
 
+    stop_event = threading.Event()
+    frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    threads = []
+
     try:
         with mss.mss() as sct:
             # 获取主显示器的尺寸
             monitor = sct.monitors[1]
-            width = monitor["width"]
-            height = monitor["height"]
-            
-            # 定义视频编码器并创建VideoWriter对象
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            out = cv2.VideoWriter(OUTPUT_FILENAME, fourcc, FPS, (width, height))
-
-            while True:
-                # 抓取屏幕图像
-                img = sct.grab(monitor)
-                
-                # 将图像转换为OpenCV可以处理的NumPy数组
-                frame = np.array(img)
-                
-                # 转换颜色空间 BGRA -> BGR
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-
-                # 将帧写入视频文件
-                out.write(frame_bgr)
-                
+        width = monitor["width"]
+        height = monitor["height"]
+
+        if output_filename == OUTPUT_FILENAME:
+            # 启动 NVENC 硬件编码进程
+            proc = start_encoder(width, height)
+            write = lambda frame: write_frame(proc.stdin, frame)
+        else:
+            print(f"未找到 {FFMPEG_BINARY}，改用 OpenCV XVID 编码。")
+            writer, write = open_xvid_writer(width, height)
+
+        threads = [
+            threading.Thread(target=capture_frames, args=(monitor, frame_queue, stop_event), daemon=True),
+            threading.Thread(target=encode_frames, args=(write, frame_queue, stop_event), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        # 主线程只负责等待 Ctrl+C，带超时的 join 保证中断信号能被及时处理
+        while not stop_event.is_set():
+            threads[0].join(timeout=0.5)
+            if not threads[0].is_alive():
+                break
+
     except KeyboardInterrupt:
         # 允许通过 Ctrl+C 停止
         print("\n检测到键盘中断(Ctrl+C)，正在停止录制...")
     finally:
         # 释放所有资源
         print("正在保存文件...")
-        if 'out' in locals() and out.isOpened():
-            out.release()
-        print(f"录屏已保存为: {OUTPUT_FILENAME}")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        if 'proc' in locals():
+            # 关闭 stdin 通知 FFmpeg 输入结束，并等待其写完文件
+            proc.stdin.close()
+            proc.wait()
+        if 'writer' in locals():
+            writer.release()
+        print(f"录屏已保存为: {output_filename}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,11 +2,40 @@
 import os
 import sys
 import json
+import re
 import argparse
+import functools
+import threading
+import httpx
 import openai
 
+try:
+    import orjson
+except ImportError:
+    # Fall back to the standard library when orjson is not installed.
+    orjson = None
+
 # This script is standalone and does not import from the main project's src folder.
 
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+# Upper bound on pooled connections shared by all requests made through a cached client.
+MAX_HTTP_CONNECTIONS = 8
+
+# api_key -> openai.OpenAI; reusing the client keeps its connection pool (and TLS sessions) alive between calls.
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Blocks that are always offered to the model, whatever the prompt says.
+CORE_ITEMS = (
+    "stone", "cobblestone", "stone_bricks", "oak_planks", "oak_log", "glass", "glass_pane",
+    "dirt", "grass_block", "sand", "torch", "lantern", "white_wool",
+)
+# Prompt words that would only match item names by accident.
+PROMPT_STOPWORDS = {"the", "and", "with", "for", "small", "little", "big", "large", "cute", "some", "that", "made"}
+
+# While streaming, report progress to the status callback every this many received characters.
+STREAM_STATUS_INTERVAL = 200
+
 def get_api_key_from_config():
     """
     Reads the DeepSeek API key from the config files with correct priority.
@@ -37,36 +66,89 @@ def get_api_key_from_config():
         
     return None # Return None if no key is found
 
-def get_minecraft_item_list():
+@functools.lru_cache(maxsize=1)
+def _load_item_names():
     """
-    Reads the list of Minecraft items from the txt file.
+    Reads the item list file once and returns its names deduplicated, without the "minecraft:" prefix, sorted.
     """
     list_path = os.path.join(os.path.dirname(__file__), '我的世界清单名称.txt')
     try:
         with open(list_path, 'r', encoding='utf-8') as f:
-            return f.read()
+            text = f.read()
     except Exception as e:
         print(f"Error reading item list: {e}")
-        return ""
+        return ()
+    names = set()
+    for line in text.splitlines():
+        name = line.strip()
+        if name.startswith("minecraft:"):
+            name = name[len("minecraft:"):]
+        if name:
+            names.add(name)
+    return tuple(sorted(names))
+
+def get_minecraft_item_list(prompt=None):
+    """
+    Returns the Minecraft item names to put in the system prompt, comma separated.
+    When a prompt is given, only items sharing a keyword with it (plus a small core set) are kept;
+    if no keyword matches (e.g. a non-English prompt) the full list is returned.
+    """
+    names = _load_item_names()
+    if prompt:
+        keywords = {word[:-1] if word.endswith('s') and len(word) > 3 else word
+                    for word in re.findall(r'[a-z]{3,}', prompt.lower()) if word not in PROMPT_STOPWORDS}
+        relevant = [name for name in names if any(keyword in name for keyword in keywords)]
+        if relevant:
+            core = [name for name in CORE_ITEMS if name in names]
+            names = sorted(set(relevant).union(core))
+    return ", ".join(names)
+
+def _make_http_client():
+    """
+    Builds the pooled HTTP client used by the OpenAI SDK, with HTTP/2 when the 'h2' package is available.
+    """
+    try:
+        import h2  # noqa: F401  (httpx needs it for http2=True)
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(max_connections=MAX_HTTP_CONNECTIONS, max_keepalive_connections=MAX_HTTP_CONNECTIONS),
+    )
 
-def generate_decoration(prompt: str, api_key: str, status_callback=print):
+def get_client(api_key: str):
+    """
+    Returns the cached DeepSeek client for this key, creating it on first use.
+    """
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(api_key)
+        if client is None:
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=DEEPSEEK_BASE_URL,
+                timeout=60.0,  # Set timeout to 60 seconds
+                http_client=_make_http_client(),
+            )
+            _CLIENTS[api_key] = client
+        return client
+
+def generate_decoration(prompt: str, api_key: str, status_callback=print, client=None):
     """
     Generates a small 5x5x5 decoration using the deepseek model.
     The status_callback function is used to send status updates to the caller (e.g., a GUI).
+    An existing client can be passed in; otherwise the cached client for api_key is used.
     """
     output_dir = os.path.join(os.path.dirname(__file__), '..', 'box')
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    item_list = get_minecraft_item_list()
+    item_list = get_minecraft_item_list(prompt)
     if not item_list:
         status_callback("Warning: Could not read the Minecraft item list. The model may not perform well.")
 
-    client = openai.OpenAI(
-        api_key=api_key,
-        base_url="https://api.deepseek.com/v1",
-        timeout=60.0  # Set timeout to 60 seconds
-    )
+    if client is None:
+        client = get_client(api_key)
 
     system_prompt = f"""You are a Minecraft decoration designer. Your task is to design a small decoration based on the user's description and output a JSON object representing the structure.
 
@@ -93,9 +175,24 @@ Here is a list of available block types:
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            stream=False
+            stream=True
         )
-        llm_output = response.choices[0].message.content
+        # Collect the streamed tokens so the caller gets progress updates instead of a long silent wait.
+        chunks = []
+        received = 0
+        next_report = STREAM_STATUS_INTERVAL
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            chunks.append(delta)
+            received += len(delta)
+            if received >= next_report:
+                status_callback(f"Receiving response... {received} characters so far.")
+                next_report += STREAM_STATUS_INTERVAL
+        llm_output = "".join(chunks)
         status_callback("Successfully received response from model.")
         
         if llm_output.strip().startswith("```json"):
@@ -106,11 +203,22 @@ Here is a list of available block types:
         data["description"] = prompt
 
         if "blocks" in data and isinstance(data["blocks"], list):
+            # Sort by (block_type, y, z, x) so same-type rows are contiguous for the listener's /fill merging.
+            # Duplicate coordinates keep the last block, as they would when placed one by one.
+            unique_blocks = {}
+            for block in data["blocks"]:
+                unique_blocks[(block.get('x', 0), block.get('y', 0), block.get('z', 0))] = block
+            data["blocks"] = sorted(unique_blocks.values(),
+                                    key=lambda b: (str(b.get('block_type', '')), b.get('y', 0), b.get('z', 0), b.get('x', 0)))
             filename = prompt.replace(" ", "_").replace("\"", "").replace("'", "")[:20]
             output_filepath = os.path.join(output_dir, f"{filename}.json")
             
-            with open(output_filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            if orjson is not None:
+                payload = orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+            else:
+                payload = (json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+            with open(output_filepath, 'wb') as f:
+                f.write(payload)
             
             status_callback(f"Successfully saved decoration to {output_filepath}")
             return output_filepath
@@ -8,7 +8,7 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import QThread, pyqtSignal
 
 # Import the necessary functions from our generator script
-from decoration_generator import get_api_key_from_config, generate_decoration
+from decoration_generator import get_api_key_from_config, get_client, generate_decoration
 
 class GenerationThread(QThread):
     """Worker thread for running the blocking generation task."""
@@ -17,10 +17,11 @@ class GenerationThread(QThread):
     # Signal to indicate completion
     finished = pyqtSignal()
 
-    def __init__(self, prompt, api_key):
+    def __init__(self, prompt, api_key, client):
         super().__init__()
         self.prompt = prompt
         self.api_key = api_key
+        self.client = client
 
     def run(self):
         """The entry point for the thread."""
@@ -28,7 +29,7 @@ class GenerationThread(QThread):
             # This function will be called by generate_decoration
             self.status_updated.emit(message)
 
-        generate_decoration(self.prompt, self.api_key, status_callback=status_callback)
+        generate_decoration(self.prompt, self.api_key, status_callback=status_callback, client=self.client)
         self.finished.emit()
 
 class GeneratorGUI(QWidget):
@@ -37,6 +38,7 @@ class GeneratorGUI(QWidget):
         self.setWindowTitle('Minecraft Decoration Generator')
         self.init_ui()
         self.api_key = None
+        self.client = None
         self.generation_thread = None
         self.load_api_key()
 
@@ -77,6 +79,8 @@ class GeneratorGUI(QWidget):
                                'that \'config/api_keys_list.json\' is not empty.')
             self.generate_button.setEnabled(False)
         else:
+            # Create the client once so every generation reuses the same connection pool.
+            self.client = get_client(self.api_key)
             self.update_status('API Key loaded successfully. Ready to generate.')
 
     def start_generation(self):
@@ -92,7 +96,7 @@ class GeneratorGUI(QWidget):
         self.update_status(f'Starting generation for: "{prompt}"...')
 
         # Create and start the worker thread
-        self.generation_thread = GenerationThread(prompt, self.api_key)
+        self.generation_thread = GenerationThread(prompt, self.api_key, self.client)
         self.generation_thread.status_updated.connect(self.update_status)
         self.generation_thread.finished.connect(self.on_generation_finished)
         self.generation_thread.start()
@@ -5,29 +5,227 @@ import json
 import re
 import time
 import sys
+import struct
+import threading
 
 # Attempt to import required libraries, provide instructions if they fail.
 try:
-    from mcrcon import MCRcon
-    import tailer
+    from mcrcon import MCRcon, MCRconException
+    import numpy as np
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
 except ImportError as e:
     print(f"Error: A required library is not installed: {e.name}")
     if e.name == "mcrcon":
         print("Please install it by running: pip install mcrcon")
-    elif e.name == "tailer":
-        print("Please install it by running: pip install tailer")
+    elif e.name == "watchdog":
+        print("Please install it by running: pip install watchdog")
+    elif e.name == "numpy":
+        print("Please install it by running: pip install numpy")
     sys.exit(1)
 
+# The vanilla /fill command refuses regions larger than this many blocks.
+MAX_FILL_VOLUME = 32768
+# Build commands are pipelined: this many are sent back to back before their replies are read.
+# Waiting for each batch's replies is the backpressure for a build.
+RCON_BATCH_SIZE = 32
+# Packet type appended to every batch as a sentinel. Servers answer unknown types with "Unknown request"
+# and handle requests in order, so once the sentinel's reply arrives every reply of the batch,
+# including long replies split over several packets, has been read.
+SENTINEL_PACKET_TYPE = 0
+# If a server still drops commands, set this to the number of commands to send per server tick (50 ms).
+COMMANDS_PER_TICK = 0
+SERVER_TICK_SECONDS = 0.05
+
+# Chat commands: "list" and "add <number>". The pattern is matched right after the "]: <"
+# chat marker, so it starts at the player name; everything it matches is ASCII.
+CHAT_PATTERN = re.compile(r'([a-zA-Z0-9_-]+)> (list|add (\d+))', re.ASCII)
+# Chat lines contain this marker; it is pure ASCII, so it can be searched for in the raw GBK bytes.
+CHAT_MARKER = b']: <'
+# Re-check the log this often even without a file event, in case a notification is missed.
+LOG_WAIT_TIMEOUT = 1.0
+
+class PipelinedMCRcon(MCRcon):
+    """
+    MCRcon that can send several commands before reading any reply.
+    Each command in a batch gets its own request id so replies can be matched back to it.
+    Ids keep increasing over the whole connection, so they never collide with an earlier batch
+    (MCRcon's own commands use id 0).
+    """
+    _last_id = 0
+
+    def _new_id(self):
+        # Stay within positive int32.
+        self._last_id = self._last_id % 0x7FFFFFFF + 1
+        return self._last_id
+
+    def _read_packet(self):
+        (length,) = struct.unpack("<i", self._read(4))
+        payload = self._read(length)
+        request_id, _ = struct.unpack("<ii", payload[:8])
+        if payload[-2:] != b"\x00\x00":
+            raise MCRconException("Incorrect padding")
+        return request_id, payload[8:-2].decode("utf8")
+
+    def command_batch(self, commands):
+        """Sends all commands in a single write and returns their replies in the same order."""
+        if self.socket is None:
+            raise MCRconException("Must connect before sending data")
+
+        indices = {}
+        packets = bytearray()
+        for index, command in enumerate(commands):
+            request_id = self._new_id()
+            indices[request_id] = index
+            packets += self._packet(request_id, 2, command)
+        sentinel_id = self._new_id()
+        packets += self._packet(sentinel_id, SENTINEL_PACKET_TYPE, "")
+        self.socket.sendall(packets)
+
+        replies = [""] * len(commands)
+        while True:
+            # Long replies arrive split over several packets with the same id; read until the sentinel answers.
+            request_id, data = self._read_packet()
+            if request_id == sentinel_id:
+                return replies
+            index = indices.get(request_id)
+            if index is not None:
+                replies[index] += data
+
+    @staticmethod
+    def _packet(request_id, packet_type, body):
+        payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf8") + b"\x00\x00"
+        return struct.pack("<i", len(payload)) + payload
+
+class _LogChangeHandler(FileSystemEventHandler):
+    """Sets an event whenever the watched log file is modified, created or moved into place."""
+    def __init__(self, log_path, changed):
+        super().__init__()
+        self.log_path = os.path.normcase(os.path.abspath(log_path))
+        self.changed = changed
+
+    def on_any_event(self, event):
+        for path in (event.src_path, getattr(event, 'dest_path', '')):
+            if path and os.path.normcase(os.path.abspath(path)) == self.log_path:
+                self.changed.set()
+                return
+
+def follow_log(log_path):
+    """
+    Yields each line appended to the log file as raw bytes, starting from its current end.
+    Waits on file system notifications instead of polling, and reopens the file when the
+    server rotates it.
+    """
+    changed = threading.Event()
+    observer = Observer()
+    observer.schedule(_LogChangeHandler(log_path, changed), os.path.dirname(os.path.abspath(log_path)), recursive=False)
+    observer.start()
+    log_file = open(log_path, 'rb')
+    try:
+        log_file.seek(0, os.SEEK_END)
+        pending = bytearray()
+        while True:
+            changed.wait(LOG_WAIT_TIMEOUT)
+            changed.clear()
+            try:
+                stat = os.stat(log_path)
+            except OSError:
+                continue  # The file is being rotated; wait for it to reappear.
+            if stat.st_ino != os.fstat(log_file.fileno()).st_ino or stat.st_size < log_file.tell():
+                log_file.close()
+                log_file = open(log_path, 'rb')
+                pending.clear()
+
+            chunk = log_file.read()
+            if not chunk:
+                continue
+            pending += chunk
+            end = pending.rfind(b'\n')
+            if end < 0:
+                continue
+            lines = bytes(pending[:end]).split(b'\n')
+            del pending[:end + 1]
+            yield from lines
+    finally:
+        log_file.close()
+        observer.stop()
+        observer.join()
+
+def blocks_to_columns(blocks):
+    """
+    Converts the JSON block list into columns: int32 arrays for 'x', 'y', 'z'
+    and a list of strings for 'block_type'.
+    """
+    count = len(blocks)
+    return {
+        'x': np.fromiter((block['x'] for block in blocks), dtype=np.int32, count=count),
+        'y': np.fromiter((block['y'] for block in blocks), dtype=np.int32, count=count),
+        'z': np.fromiter((block['z'] for block in blocks), dtype=np.int32, count=count),
+        'block_type': [block['block_type'] for block in blocks],
+    }
+
+def merge_blocks_into_boxes(columns):
+    """
+    Greedily covers the blocks (given as columns) with axis-aligned boxes of a single block type.
+    Returns a list of (x1, y1, z1, x2, y2, z2, block_type) tuples, ordered bottom-up
+    so that supporting blocks are placed before anything attached to them.
+    """
+    if not len(columns['x']):
+        return []
+    palette, type_ids = np.unique(np.asarray(columns['block_type']), return_inverse=True)
+    type_ids = type_ids.reshape(-1).astype(np.int32)
+
+    # Dense grid of palette ids over the bounding box; -1 means empty or already covered.
+    origin = np.array([columns['x'].min(), columns['y'].min(), columns['z'].min()])
+    xs = columns['x'] - origin[0]
+    ys = columns['y'] - origin[1]
+    zs = columns['z'] - origin[2]
+    shape = (int(xs.max()) + 1, int(ys.max()) + 1, int(zs.max()) + 1)
+    flat = np.ravel_multi_index((xs, ys, zs), shape)
+    # Later entries overwrite earlier ones, matching the old one-setblock-per-block order.
+    _, last_reversed = np.unique(flat[::-1], return_index=True)
+    keep = len(flat) - 1 - last_reversed
+    grid = np.full(shape, -1, dtype=np.int32)
+    grid.flat[flat[keep]] = type_ids[keep]
+    size_x, size_y, size_z = shape
+
+    boxes = []
+    for i in keep[np.lexsort((xs[keep], zs[keep], ys[keep]))].tolist():
+        x1, y1, z1 = int(xs[i]), int(ys[i]), int(zs[i])
+        type_id = grid[x1, y1, z1]
+        if type_id < 0:
+            continue
+        x2, y2, z2 = x1, y1, z1
+
+        # Extend along +x, then grow the row along +y, then the slab along +z.
+        while (x2 + 1 < size_x and (x2 - x1 + 2) <= MAX_FILL_VOLUME and
+               grid[x2 + 1, y1, z1] == type_id):
+            x2 += 1
+        while (y2 + 1 < size_y and (x2 - x1 + 1) * (y2 - y1 + 2) <= MAX_FILL_VOLUME and
+               (grid[x1:x2 + 1, y2 + 1, z1] == type_id).all()):
+            y2 += 1
+        while (z2 + 1 < size_z and (x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 2) <= MAX_FILL_VOLUME and
+               (grid[x1:x2 + 1, y1:y2 + 1, z2 + 1] == type_id).all()):
+            z2 += 1
+
+        grid[x1:x2 + 1, y1:y2 + 1, z1:z2 + 1] = -1
+        ox, oy, oz = (int(v) for v in origin)
+        boxes.append((x1 + ox, y1 + oy, z1 + oz, x2 + ox, y2 + oy, z2 + oz, str(palette[type_id])))
+
+    boxes.sort(key=lambda box: (box[1], box[2], box[0]))
+    return boxes
+
 class DecorationBuilderListener:
     def __init__(self):
         self.config = self._load_config()
         if not self.config:
             sys.exit(1)
         
-        self.rcon_client = MCRcon(self.config['server_address'], self.config['rcon_password'])
-        # New regex to capture commands: "list" and "add <number>"
-        self.chat_pattern = re.compile(r'<([a-zA-Z0-9_-]+)> (list|add (\d+))')
+        self.rcon_client = PipelinedMCRcon(self.config['server_address'], self.config['rcon_password'])
+        self.chat_pattern = CHAT_PATTERN
         self.box_dir = os.path.join(os.path.dirname(__file__), '..', 'box')
+        # filename -> (mtime_ns, size, parsed JSON or None if the file could not be read)
+        self._decor_cache = {}
 
     def _load_config(self):
         config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'rcon_settings.json')
@@ -59,11 +257,41 @@ class DecorationBuilderListener:
         self.rcon_client.command(f"tellraw {player_name} {msg_json}")
 
     def _get_decorations(self):
-        """Scans the box directory for valid .json files and returns a sorted list of filenames."""
+        """
+        Scans the box directory for valid .json files and returns a sorted list of filenames.
+        A single scandir pass refreshes the cache; only files whose mtime or size changed are re-parsed.
+        """
         if not os.path.exists(self.box_dir):
+            self._decor_cache = {}
             return []
-        files = [f for f in os.listdir(self.box_dir) if f.endswith('.json')]
-        return sorted(files)
+
+        cache = {}
+        with os.scandir(self.box_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                stat = entry.stat()
+                cached = self._decor_cache.get(entry.name)
+                if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                    cache[entry.name] = cached
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    print(f"Error reading JSON {entry.path}: {e}")
+                    data = None
+                cache[entry.name] = (stat.st_mtime_ns, stat.st_size, data)
+
+        self._decor_cache = cache
+        return sorted(cache)
+
+    def _get_decoration_data(self, filename):
+        """Returns the cached JSON of a decoration listed by the last scan, or None if it is unreadable."""
+        cached = self._decor_cache.get(filename)
+        if cached is None or not isinstance(cached[2], dict):
+            return None
+        return cached[2]
 
     def _list_decorations(self, player_name):
         """Lists available decorations to the player in chat."""
@@ -74,47 +302,55 @@ class DecorationBuilderListener:
 
         self._tell_player(player_name, "--- Available Decorations ---", "yellow")
         for i, filename in enumerate(decorations):
-            try:
-                with open(os.path.join(self.box_dir, filename), 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    description = data.get('description', 'No description')
+            data = self._get_decoration_data(filename)
+            if data is not None:
+                description = data.get('description', 'No description')
                 self._tell_player(player_name, f"[{i+1}] {description}", "white")
-            except Exception:
+            else:
                 self._tell_player(player_name, f"[{i+1}] Error reading: {filename}", "dark_red")
         self._tell_player(player_name, "Use 'add <number>' to build.", "aqua")
 
+    def _flush_batch(self, batch):
+        """Sends the queued commands as one pipelined RCON batch and empties the list."""
+        if not batch:
+            return
+        self.rcon_client.command_batch(batch)
+        batch.clear()
+        if COMMANDS_PER_TICK:
+            time.sleep(SERVER_TICK_SECONDS)
+
     def _build_decoration(self, player_name, decoration_filename):
         base_coords = self._get_player_position(player_name)
         if not base_coords:
             return
         base_x, base_y, base_z = base_coords
 
-        json_path = os.path.join(self.box_dir, decoration_filename)
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            blocks = data.get("blocks", [])
-            description = data.get("description", decoration_filename)
-        except Exception as e:
+        data = self._get_decoration_data(decoration_filename)
+        if data is None:
             self._tell_player(player_name, "Failed to read or parse decoration file.", "red")
-            print(f"Error reading JSON {json_path}: {e}")
             return
+        blocks = data.get("blocks", [])
+        description = data.get("description", decoration_filename)
 
         if not blocks:
             self._tell_player(player_name, "Decoration file is empty.", "yellow")
             return
 
-        self._tell_player(player_name, f"Starting to build '{description}'... ({len(blocks)} blocks)")
-        for i, block in enumerate(blocks):
-            abs_x = base_x + block['x']
-            abs_y = base_y + block['y']
-            abs_z = base_z + block['z']
-            block_type = block['block_type']
-            cmd = f"setblock {abs_x} {abs_y} {abs_z} {block_type}"
-            self.rcon_client.command(cmd)
-            if (i + 1) % 100 == 0:
-                time.sleep(0.1)
-        
+        # Convert once to columns; the box cover works on the int32 coordinate arrays.
+        boxes = merge_blocks_into_boxes(blocks_to_columns(blocks))
+        self._tell_player(player_name, f"Starting to build '{description}'... ({len(blocks)} blocks, {len(boxes)} commands)")
+        batch_size = min(RCON_BATCH_SIZE, COMMANDS_PER_TICK) if COMMANDS_PER_TICK else RCON_BATCH_SIZE
+        batch = []
+        for x1, y1, z1, x2, y2, z2, block_type in boxes:
+            start = f"{base_x + x1} {base_y + y1} {base_z + z1}"
+            if (x1, y1, z1) == (x2, y2, z2):
+                batch.append(f"setblock {start} {block_type}")
+            else:
+                batch.append(f"fill {start} {base_x + x2} {base_y + y2} {base_z + z2} {block_type}")
+            if len(batch) >= batch_size:
+                self._flush_batch(batch)
+        self._flush_batch(batch)
+
         self._tell_player(player_name, f"Successfully built '{description}'!", "green")
         print(f"Finished building {description} for {player_name}.")
 
@@ -130,11 +366,16 @@ class DecorationBuilderListener:
             self.rcon_client.connect()
             self._tell_player("@a", "Decoration listener is now active.", "aqua")
             
-            for line in tailer.follow(open(log_path, encoding='gbk', errors='replace')):
-                if '<' not in line or '>' not in line:
+            for raw_line in follow_log(log_path):
+                # Cheap byte search first: most log lines are not chat and are never decoded.
+                if CHAT_MARKER not in raw_line:
+                    continue
+
+                line = raw_line.decode('gbk', errors='replace')
+                idx = line.find(']: <')
+                if idx < 0:
                     continue
-                
-                match = self.chat_pattern.search(line)
+                match = self.chat_pattern.match(line, idx + 4)
                 if not match:
                     continue
 
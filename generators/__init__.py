@@ -0,0 +1,36 @@
+# generators/__init__.py
+import importlib
+
+# ==============================================================================
+#                             生成器注册表
+# ==============================================================================
+# 脚本名 -> 生成器类名。总规划师通过注册表在本进程内直接调用这些生成器，
+# 不必为每个子任务启动一个新的解释器；生成器设计师新建的脚本不在表中，仍以子进程运行。
+# 模块在第一次用到时才导入，某个脚本出错不影响其它生成器。
+REGISTRY = {
+    'building_generator': 'BuildingGenerator',
+    'castle_generator': 'MedievalCastleGenerator',
+    'cube_generator': 'CubeGenerator',
+    'decoration_generator': 'DecorationGenerator',
+    'flat_land_generator': 'FlatLandGenerator',
+    'heart_landscape_generator': 'HeartLandscapeGenerator',
+    'interior_generator': 'InteriorGenerator',
+    'landscape_generator': 'LandscapeGenerator',
+    'lighting_generator': 'LightingGenerator',
+    'long_wall_generator': 'SmartWallGenerator',
+    'path_road_generator': 'PathRoadGenerator',
+    'portal_generator': 'PortalGenerator',
+    'redstone_generator': 'RedstoneLampCircuitGenerator',
+    'villager_generator': 'VillagerGenerator',
+    'yard_generator': 'YardGenerator',
+}
+
+def get_generator_class(script_name):
+    """根据脚本名（可带 .py 后缀）返回注册的生成器类；未注册时返回 None。"""
+    if script_name.endswith('.py'):
+        script_name = script_name[:-3]
+    class_name = REGISTRY.get(script_name)
+    if class_name is None:
+        return None
+    module = importlib.import_module(f"{__name__}.{script_name}")
+    return getattr(module, class_name)
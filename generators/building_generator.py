@@ -7,7 +7,7 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file, generate_blocks_from_task
+from src.util import get_llm_client, stream_llm_components, write_json_file, generate_columns_with_bbox, sort_columns, compute_spatial_metadata
 from src.key_manager import get_next_api_key
 
 BUILD_DIR = os.path.join(current_dir, '../build')
@@ -69,59 +69,35 @@ class BuildingGenerator:
         user_prompt = f"设计一个Minecraft建筑：{description}"
         print(f"BuildingGenerator: Sending prompt to LLM: {user_prompt}")
 
-        success, llm_output = get_llm_response(self.llm_client, system_prompt, user_prompt)
+        def report_progress(received):
+            print(f"\rBuildingGenerator: Receiving LLM output... {received} chars", end="", flush=True)
 
-        if not success:
-            print(f"BuildingGenerator: Error from LLM: {llm_output}")
-            return {"description": description, "generated_structure": {}, "blocks": []}
-        
-        # Validate LLM output structure
-        if not isinstance(llm_output, list):
-            print(f"BuildingGenerator: LLM output is not a list: {llm_output}")
-            return {"description": description, "generated_structure": {}, "blocks": []}
-        
+        # 流式接收LLM输出，每个图元一到达就立即展开，展开与后续 token 的接收相互重叠
         generated_components = []
-        for item in llm_output:
-            if not isinstance(item, dict) or 'tool' not in item or 'args' not in item:
-                print(f"BuildingGenerator: Invalid component in LLM output: {item}")
-                continue
-            generated_components.append(item)
-
-        print(f"BuildingGenerator: Received LLM output: {generated_components}")
-
-        actual_block_commands = []
-        for component_task in generated_components:
-            blocks = generate_blocks_from_task(component_task)
-            actual_block_commands.extend(blocks)
-
-        # Calculate bounding box and dimensions
-        min_x, min_y, min_z = float('inf'), float('inf'), float('inf')
-        max_x, max_y, max_z = float('-inf'), float('-inf'), float('-inf')
-
-        if actual_block_commands:
-            for block in actual_block_commands:
-                min_x = min(min_x, block['x'])
-                min_y = min(min_y, block['y'])
-                min_z = min(min_z, block['z'])
-                max_x = max(max_x, block['x'])
-                max_y = max(max_y, block['y'])
-                max_z = max(max_z, block['z'])
-            
-            width = max_x - min_x + 1
-            height = max_y - min_y + 1
-            depth = max_z - min_z + 1
-        else:
-            min_x, min_y, min_z = 0, 0, 0
-            max_x, max_y, max_z = 0, 0, 0
-            width, height, depth = 0, 0, 0
-
-        spatial_metadata = {
-            "bounding_box": {
-                "min_x": min_x, "min_y": min_y, "min_z": min_z,
-                "max_x": max_x, "max_y": max_y, "max_z": max_z
-            },
-            "dimensions": {"width": width, "height": height, "depth": depth}
-        }
+
+        def valid_components():
+            for item in stream_llm_components(self.llm_client, system_prompt, user_prompt,
+                                              progress_callback=report_progress):
+                if not isinstance(item, dict) or 'tool' not in item or 'args' not in item:
+                    print(f"\nBuildingGenerator: Invalid component in LLM output: {item}")
+                    continue
+                generated_components.append(item)
+                yield item
+
+        try:
+            block_columns, bbox = generate_columns_with_bbox(valid_components())
+        except Exception as e:
+            print(f"\nBuildingGenerator: Error from LLM: {e}")
+            return {"description": description, "generated_structure": {}, "blocks": []}
+        print()
+
+        print(f"BuildingGenerator: Received {len(generated_components)} components from LLM.")
+
+        # 预先按 (方块类型, y, z, x) 排序，放置时可以直接按行合并为 /fill；
+        # sort_columns 会先去除重叠图元产生的重复坐标，同一坐标只保留最后写入的方块
+        block_columns = sort_columns(block_columns)
+
+        spatial_metadata = compute_spatial_metadata(bbox=bbox)
 
         final_generated_structure = {
             "design_components": generated_components,
@@ -131,7 +107,7 @@ class BuildingGenerator:
         build_plan = {
             "description": description,
             "generated_structure": final_generated_structure, # Store the LLM's structured output with metadata
-            "blocks": actual_block_commands
+            "blocks": block_columns
         }
 
         print(f"BuildingGenerator: Finished generating plan for: {description}")
@@ -10,7 +10,7 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file, generate_blocks_from_task
+from src.util import get_llm_client, get_llm_response, write_json_file, generate_columns_with_bbox, sort_columns, compute_spatial_metadata
 from src.key_manager import get_next_api_key
 
 BUILD_DIR = os.path.join(current_dir, '../build')
@@ -47,38 +47,12 @@ Ensure the design is structurally sound, aesthetically pleasing, and follows med
             print(f"MedievalCastleGenerator: Failed to get a valid list from LLM. Response: {llm_output}")
             return { "description": description, "blocks": [] }
         
-        actual_block_commands = []
-        for component_task in llm_output:
-            blocks = generate_blocks_from_task(component_task)
-            actual_block_commands.extend(blocks)
-
-        min_x, min_y, min_z = float('inf'), float('inf'), float('inf')
-        max_x, max_y, max_z = float('-inf'), float('-inf'), float('-inf')
-
-        if actual_block_commands:
-            for block in actual_block_commands:
-                min_x = min(min_x, block['x'])
-                min_y = min(min_y, block['y'])
-                min_z = min(min_z, block['z'])
-                max_x = max(max_x, block['x'])
-                max_y = max(max_y, block['y'])
-                max_z = max(max_z, block['z'])
-            
-            width = max_x - min_x + 1
-            height = max_y - min_y + 1
-            depth = max_z - min_z + 1
-        else:
-            min_x, min_y, min_z = 0, 0, 0
-            max_x, max_y, max_z = 0, 0, 0
-            width, height, depth = 0, 0, 0
-
-        spatial_metadata = {
-            "bounding_box": {
-                "min_x": min_x, "min_y": min_y, "min_z": min_z,
-                "max_x": max_x, "max_y": max_y, "max_z": max_z
-            },
-            "dimensions": {"width": width, "height": height, "depth": depth}
-        }
+        block_columns, bbox = generate_columns_with_bbox(llm_output)
+        # 预先按 (方块类型, y, z, x) 排序，放置时可以直接按行合并为 /fill；
+        # sort_columns 会先去除重叠图元产生的重复坐标，同一坐标只保留最后写入的方块
+        block_columns = sort_columns(block_columns)
+
+        spatial_metadata = compute_spatial_metadata(bbox=bbox)
 
         final_generated_structure = {
             "design_components": llm_output,
@@ -88,7 +62,7 @@ Ensure the design is structurally sound, aesthetically pleasing, and follows med
         build_plan = {
             "description": description,
             "generated_structure": final_generated_structure,
-            "blocks": actual_block_commands
+            "blocks": block_columns
         }
         
         return build_plan
@@ -7,7 +7,7 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file, generate_blocks_from_task
+from src.util import get_llm_client, get_llm_response, write_json_file, generate_columns_with_bbox, compute_spatial_metadata
 from src.key_manager import get_next_api_key
 
 BUILD_DIR = os.path.join(current_dir, '../build')
@@ -50,41 +50,12 @@ class CubeGenerator:
             return {"description": description, "generated_structure": {}, "blocks": []}
         
         generated_components = llm_output
-        print(f"CubeGenerator: Received LLM output: {generated_components}")
-
-        actual_block_commands = []
-        for component_task in generated_components:
-            blocks = generate_blocks_from_task(component_task)
-            actual_block_commands.extend(blocks)
-
-        # Calculate bounding box and dimensions
-        min_x, min_y, min_z = float('inf'), float('inf'), float('inf')
-        max_x, max_y, max_z = float('-inf'), float('-inf'), float('-inf')
-
-        if actual_block_commands:
-            for block in actual_block_commands:
-                min_x = min(min_x, block['x'])
-                min_y = min(min_y, block['y'])
-                min_z = min(min_z, block['z'])
-                max_x = max(max_x, block['x'])
-                max_y = max(max_y, block['y'])
-                max_z = max(max_z, block['z'])
-            
-            width = max_x - min_x + 1
-            height = max_y - min_y + 1
-            depth = max_z - min_z + 1
-        else:
-            min_x, min_y, min_z = 0, 0, 0
-            max_x, max_y, max_z = 0, 0, 0
-            width, height, depth = 0, 0, 0
-
-        spatial_metadata = {
-            "bounding_box": {
-                "min_x": min_x, "min_y": min_y, "min_z": min_z,
-                "max_x": max_x, "max_y": max_y, "max_z": max_z
-            },
-            "dimensions": {"width": width, "height": height, "depth": depth}
-        }
+        print(f"CubeGenerator: Received {len(generated_components)} components from LLM.")
+
+        block_columns, bbox = generate_columns_with_bbox(generated_components)
+
+        # 边界框在展开图元时已经累计好
+        spatial_metadata = compute_spatial_metadata(bbox=bbox)
 
         final_generated_structure = {
             "design_components": generated_components,
@@ -94,7 +65,7 @@ class CubeGenerator:
         build_plan = {
             "description": description,
             "generated_structure": final_generated_structure,
-            "blocks": actual_block_commands
+            "blocks": block_columns
         }
 
         print(f"CubeGenerator: Finished generating plan for: {description}")
@@ -1,15 +1,16 @@
 
 import os
 import sys
+import copy
 import json
-import math
+import asyncio
 import argparse
 
 # Add root directory to sys.path to import from src
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file, generate_blocks_from_task
+from src.util import get_llm_client, get_cached_llm_response, lookup_cached_llm_response, store_cached_llm_response, get_async_llm_client, get_llm_response_async, write_json_file, generate_columns_with_bbox, compute_spatial_metadata
 from src.key_manager import get_next_api_key
 
 BUILD_DIR = os.path.join(current_dir, '../build')
@@ -20,6 +21,14 @@ class SmartWallGenerator:
     """
     SEGMENT_LENGTH = 15  # The standard length of one wall segment
     SEGMENTATION_THRESHOLD = 20 # If the wall is longer than this, use segmented generation
+    MAX_CONCURRENT_SEGMENTS = 4 # How many segment requests may be in flight at once
+    SEGMENTS_PER_REQUEST = 4 # How many segments are designed together in one LLM request
+    SEGMENT_CACHE_MAX_AGE = 86400 # Reuse a cached segment design for at most a day, so walls keep some variety
+
+    SEGMENT_SYSTEM_PROMPT = """You are a Minecraft builder. Your task is to design a standard wall segment with a specific length and height. The wall should have some variation and detail. The origin (0,0,0) of the segment should be one of its bottom corners. Output a JSON array of primitive tools to build it."""
+
+    BATCH_SYSTEM_PROMPT = """You are a Minecraft builder. You will receive a JSON array of wall segment specifications, each with `length`, `height` and `material`. Design every segment independently; each should have some variation and detail. The origin (0,0,0) of each segment should be one of its bottom corners.
+Output a JSON array with exactly one element per specification, in the same order. Each element must itself be a JSON array of primitive tools that builds that segment."""
 
     def __init__(self, llm_client):
         self.llm_client = llm_client
@@ -46,7 +55,7 @@ class SmartWallGenerator:
         }
         ```
         """
-        success, params = get_llm_response(self.llm_client, system_prompt, description)
+        success, params = get_cached_llm_response(self.llm_client, system_prompt, description)
         if not success or not isinstance(params, dict):
             print("SmartWallGenerator: Warning - Failed to extract parameters, using defaults.")
             return {"length": 15, "height": 5, "material": "minecraft:stone_bricks"}
@@ -64,7 +73,8 @@ class SmartWallGenerator:
         system_prompt = """You are a Minecraft builder. Your task is to design a wall section based on the provided parameters and output a JSON array of primitive tools to build it. The wall should have some variation and detail, not just be a flat rectangle."""
         user_prompt = f"Design a wall with length={length}, height={height}, made primarily of {material}. The origin (0,0,0) should be one corner of the wall."
         
-        success, components = get_llm_response(self.llm_client, system_prompt, user_prompt)
+        # The prompt is fully parameterized, so only reuse a design for the exact same parameters.
+        success, components = get_cached_llm_response(self.llm_client, system_prompt, user_prompt, semantic=False)
         if not success:
             print("SmartWallGenerator: Single-call generation failed.")
             return []
@@ -73,33 +83,83 @@ class SmartWallGenerator:
     def _generate_segmented(self, length: int, height: int, material: str) -> list:
         """Generates a long wall by repeatedly generating and assembling smaller segments."""
         print(f"SmartWallGenerator: Using segmented generation for wall (Length: {length}).")
-        num_segments = math.ceil(length / self.SEGMENT_LENGTH)
-        remaining_length = length
         all_components = []
-        current_x_offset = 0
-
-        system_prompt = f"""You are a Minecraft builder. Your task is to design a standard wall segment with a specific length and height. The wall should have some variation and detail. The origin (0,0,0) of the segment should be one of its bottom corners. Output a JSON array of primitive tools to build it."""
 
-        for i in range(num_segments):
-            segment_len = min(self.SEGMENT_LENGTH, remaining_length)
-            print(f"SmartWallGenerator: Generating segment {i+1}/{num_segments} with length {segment_len}...")
-            user_prompt = f"Design a wall segment with length={segment_len}, height={height}, made primarily of {material}."
-            
-            success, segment_components = get_llm_response(self.llm_client, system_prompt, user_prompt)
-            if not success:
+        # Every segment is SEGMENT_LENGTH long except possibly the last; its x offset is simply its start.
+        length = int(length)
+        segment_offsets = range(0, length, self.SEGMENT_LENGTH)
+        segment_lengths = [min(self.SEGMENT_LENGTH, length - offset) for offset in segment_offsets]
+
+        # Segments of the same length are interchangeable, so only design each distinct length once.
+        # Each design is cached under its single-segment prompt in the persistent LLM cache, whether it came
+        # from a batched or a single request; the uncached ones are independent, so request them all concurrently.
+        segment_designs = {}
+        for segment_len in dict.fromkeys(segment_lengths):
+            hit, design = lookup_cached_llm_response(self.SEGMENT_SYSTEM_PROMPT, self._segment_prompt(segment_len, height, material),
+                                                     max_age=self.SEGMENT_CACHE_MAX_AGE)
+            if hit:
+                segment_designs[segment_len] = design
+        missing_lengths = [l for l in dict.fromkeys(segment_lengths) if l not in segment_designs]
+        if missing_lengths:
+            designs = asyncio.run(self._request_segments(missing_lengths, height, material))
+            for segment_len, (success, segment_components) in zip(missing_lengths, designs):
+                if success:
+                    segment_designs[segment_len] = segment_components
+                    store_cached_llm_response(self.SEGMENT_SYSTEM_PROMPT, self._segment_prompt(segment_len, height, material),
+                                              segment_components)
+
+        for i, (x_offset, segment_len) in enumerate(zip(segment_offsets, segment_lengths)):
+            cached = segment_designs.get(segment_len)
+            if cached is None:
                 print(f"SmartWallGenerator: Failed to generate segment {i+1}. Skipping.")
                 continue
 
-            # Add offset to the components of the current segment
+            # Copy before shifting so other segments of the same length keep the segment-local coordinates
+            segment_components = copy.deepcopy(cached)
             for comp in segment_components:
-                comp['args']['x'] = comp['args'].get('x', 0) + current_x_offset
-            
+                comp['args']['x'] = comp['args'].get('x', 0) + x_offset
+
             all_components.extend(segment_components)
-            current_x_offset += segment_len
-            remaining_length -= segment_len
-            
+
         return all_components
 
+    @staticmethod
+    def _segment_prompt(segment_len: int, height: int, material: str) -> str:
+        return f"Design a wall segment with length={segment_len}, height={height}, made primarily of {material}."
+
+    async def _request_segments(self, segment_lengths: list, height: int, material: str) -> list:
+        """
+        Designs SEGMENTS_PER_REQUEST segments per LLM request, with at most MAX_CONCURRENT_SEGMENTS requests in flight,
+        and returns one (success, components) result per segment in order.
+        Segments whose batch fails or comes back malformed are retried with one request each.
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_SEGMENTS)
+        num_segments = len(segment_lengths)
+        results = [None] * num_segments
+
+        async def request_batch(client, indices):
+            print(f"SmartWallGenerator: Generating segments {indices[0]+1}-{indices[-1]+1}/{num_segments} in one request...")
+            specs = [{"length": segment_lengths[i], "height": height, "material": material} for i in indices]
+            success, designs = await get_llm_response_async(client, self.BATCH_SYSTEM_PROMPT, json.dumps(specs), semaphore=semaphore)
+            if success and isinstance(designs, list) and len(designs) == len(indices) and all(isinstance(d, list) for d in designs):
+                for i, design in zip(indices, designs):
+                    results[i] = (True, design)
+            else:
+                print(f"SmartWallGenerator: Batch for segments {indices[0]+1}-{indices[-1]+1} was unusable, requesting them one by one.")
+
+        async def request_segment(client, i):
+            print(f"SmartWallGenerator: Generating segment {i+1}/{num_segments} with length {segment_lengths[i]}...")
+            user_prompt = self._segment_prompt(segment_lengths[i], height, material)
+            results[i] = await get_llm_response_async(client, self.SEGMENT_SYSTEM_PROMPT, user_prompt, semaphore=semaphore)
+
+        # The async client is tied to this event loop, so it lives only as long as this call.
+        async with get_async_llm_client(self.llm_client.api_key) as client:
+            batches = [list(range(start, min(start + self.SEGMENTS_PER_REQUEST, num_segments)))
+                       for start in range(0, num_segments, self.SEGMENTS_PER_REQUEST)]
+            await asyncio.gather(*(request_batch(client, indices) for indices in batches if len(indices) > 1))
+            await asyncio.gather(*(request_segment(client, i) for i in range(num_segments) if results[i] is None))
+        return results
+
     def generate(self, description: str) -> dict:
         """The main generation method with intelligent decision-making."""
         # Step 1: AI Parameter Extraction
@@ -121,28 +181,14 @@ class SmartWallGenerator:
             return {"description": description, "generated_structure": {}, "blocks": []}
 
         # Final assembly and metadata calculation (same as other generators)
-        actual_block_commands = [block for task in generated_components for block in generate_blocks_from_task(task)]
-        min_x, min_y, min_z = (float('inf'),) * 3
-        max_x, max_y, max_z = (float('-inf'),) * 3
-
-        if actual_block_commands:
-            for block in actual_block_commands:
-                min_x, min_y, min_z = min(min_x, block['x']), min(min_y, block['y']), min(min_z, block['z'])
-                max_x, max_y, max_z = max(max_x, block['x']), max(max_y, block['y']), max(max_z, block['z'])
-            width, final_height, depth = max_x - min_x + 1, max_y - min_y + 1, max_z - min_z + 1
-        else:
-            min_x, min_y, min_z, max_x, max_y, max_z, width, final_height, depth = (0,) * 9
-
-        spatial_metadata = {
-            "bounding_box": {"min_x": min_x, "min_y": min_y, "min_z": min_z, "max_x": max_x, "max_y": max_y, "max_z": max_z},
-            "dimensions": {"width": width, "height": final_height, "depth": depth}
-        }
+        block_columns, bbox = generate_columns_with_bbox(generated_components)
+        spatial_metadata = compute_spatial_metadata(bbox=bbox)
         final_generated_structure = {"design_components": generated_components, "spatial_metadata": spatial_metadata}
 
         return {
             "description": description,
             "generated_structure": final_generated_structure,
-            "blocks": actual_block_commands
+            "blocks": block_columns
         }
 
 if __name__ == '__main__':
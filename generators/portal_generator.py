@@ -10,25 +10,14 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file, generate_blocks_from_task
+from src.util import get_llm_client, get_cached_llm_response, prefetch_llm_responses, write_json_file, generate_columns_with_bbox, dedupe_columns, compute_spatial_metadata
 from src.key_manager import get_next_api_key
+from generators.yard_generator import YardGenerator
 
 BUILD_DIR = os.path.join(current_dir, '../build')
 
-class PortalGenerator:
-    """
-    A generator that creates various types of Minecraft portals with appropriate frame structures, portal effects, and activation mechanisms.
-    """
-    def __init__(self, llm_client):
-        self.llm_client = llm_client
-
-    def generate(self, description: str) -> dict:
-        """
-        The core method that generates the build plan.
-        """
-        print(f"PortalGenerator: Generating for: {description}")
-
-        system_prompt = """You are an expert Minecraft architect specializing in portal design. Your task is to design a Minecraft portal based on the user's description. The portal can be of type: nether, end, or custom.
+# The system prompt is a fixed prefix shared by every request, so the API can reuse its prompt cache
+SYSTEM_PROMPT = """You are an expert Minecraft architect specializing in portal design. Your task is to design a Minecraft portal based on the user's description. The portal can be of type: nether, end, or custom.
 
 For each portal type, consider:
 - Frame structure: Appropriate block types and dimensions
@@ -45,47 +34,44 @@ Output your design as a list of geometric primitives. Each primitive should incl
 - metadata: any additional information
 
 Ensure the design follows Minecraft portal mechanics and is buildable in the game."""
-        
+
+class PortalGenerator:
+    """
+    A generator that creates various types of Minecraft portals with appropriate frame structures, portal effects, and activation mechanisms.
+    """
+    def __init__(self, llm_client):
+        self.llm_client = llm_client
+
+    def _prompts(self, description: str):
+        """Builds the (system_prompt, user_prompt) pair sent to the LLM."""
         user_prompt = f"Design task: {description}"
-        
-        success, llm_output = get_llm_response(self.llm_client, system_prompt, user_prompt)
+        return SYSTEM_PROMPT, user_prompt
+
+    def generate(self, description: str) -> dict:
+        """
+        The core method that generates the build plan.
+        """
+        print(f"PortalGenerator: Generating for: {description}")
+
+        system_prompt, user_prompt = self._prompts(description)
+        success, llm_output = get_cached_llm_response(self.llm_client, system_prompt, user_prompt, semantic=False)
+        if success:
+            # A portal is usually followed by a yard around it; warm the cache while this plan is being built
+            prefetch_llm_responses(self.llm_client, [YardGenerator(self.llm_client)._prompts(f"a yard around {description}")])
+        return self._build_plan(description, success, llm_output)
 
+    def _build_plan(self, description: str, success: bool, llm_output) -> dict:
+        """Turns the LLM response into the build plan."""
         if not success or not isinstance(llm_output, list):
             print(f"PortalGenerator: Failed to get a valid list from LLM. Response: {llm_output}")
             return { "description": description, "blocks": [] }
         
-        actual_block_commands = []
-        for component_task in llm_output:
-            blocks = generate_blocks_from_task(component_task)
-            actual_block_commands.extend(blocks)
-
-        min_x, min_y, min_z = float('inf'), float('inf'), float('inf')
-        max_x, max_y, max_z = float('-inf'), float('-inf'), float('-inf')
-
-        if actual_block_commands:
-            for block in actual_block_commands:
-                min_x = min(min_x, block['x'])
-                min_y = min(min_y, block['y'])
-                min_z = min(min_z, block['z'])
-                max_x = max(max_x, block['x'])
-                max_y = max(max_y, block['y'])
-                max_z = max(max_z, block['z'])
-            
-            width = max_x - min_x + 1
-            height = max_y - min_y + 1
-            depth = max_z - min_z + 1
-        else:
-            min_x, min_y, min_z = 0, 0, 0
-            max_x, max_y, max_z = 0, 0, 0
-            width, height, depth = 0, 0, 0
-
-        spatial_metadata = {
-            "bounding_box": {
-                "min_x": min_x, "min_y": min_y, "min_z": min_z,
-                "max_x": max_x, "max_y": max_y, "max_z": max_z
-            },
-            "dimensions": {"width": width, "height": height, "depth": depth}
-        }
+        block_columns, bbox = generate_columns_with_bbox(llm_output)
+        # 框架、传送门和装饰等图元经常重叠，同一坐标只保留最后写入的方块
+        block_columns = dedupe_columns(block_columns)
+
+        # 边界框在展开图元时已经累计好
+        spatial_metadata = compute_spatial_metadata(bbox=bbox)
 
         final_generated_structure = {
             "design_components": llm_output,
@@ -95,7 +81,7 @@ Ensure the design follows Minecraft portal mechanics and is buildable in the gam
         build_plan = {
             "description": description,
             "generated_structure": final_generated_structure,
-            "blocks": actual_block_commands
+            "blocks": block_columns
         }
         
         return build_plan
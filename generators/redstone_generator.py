@@ -10,25 +10,13 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file, generate_blocks_from_task
+from src.util import get_llm_client, get_cached_llm_response, write_json_file, generate_columns_with_bbox, compute_spatial_metadata
 from src.key_manager import get_next_api_key
 
 BUILD_DIR = os.path.join(current_dir, '../build')
 
-class RedstoneLampCircuitGenerator:
-    """
-    Generates functional redstone lamp circuits on a 10x10 foundation with proper wiring and power sources.
-    """
-    def __init__(self, llm_client):
-        self.llm_client = llm_client
-
-    def generate(self, description: str) -> dict:
-        """
-        The core method that generates the build plan.
-        """
-        print(f"RedstoneLampCircuitGenerator: Generating for: {description}")
-
-        system_prompt = """You are an expert Minecraft redstone engineer. Design a functional redstone lamp circuit on a 10x10 foundation. The circuit must include:
+# The system prompt is a fixed prefix shared by every request, so the API can reuse its prompt cache
+SYSTEM_PROMPT = """You are an expert Minecraft redstone engineer. Design a functional redstone lamp circuit on a 10x10 foundation. The circuit must include:
 
 1. Redstone lamps arranged in a logical pattern
 2. Redstone dust for wiring connections
@@ -44,11 +32,31 @@ Output the design as a list of geometric primitives with the following structure
 - function: brief description of the component's role in the circuit
 
 Ensure the circuit is fully functional with proper signal flow and power distribution across the 10x10 area."""
-        
+
+class RedstoneLampCircuitGenerator:
+    """
+    Generates functional redstone lamp circuits on a 10x10 foundation with proper wiring and power sources.
+    """
+    def __init__(self, llm_client):
+        self.llm_client = llm_client
+
+    def _prompts(self, description: str):
+        """Builds the (system_prompt, user_prompt) pair sent to the LLM."""
         user_prompt = f"Design task: {description}"
-        
-        success, llm_output = get_llm_response(self.llm_client, system_prompt, user_prompt)
+        return SYSTEM_PROMPT, user_prompt
+
+    def generate(self, description: str) -> dict:
+        """
+        The core method that generates the build plan.
+        """
+        print(f"RedstoneLampCircuitGenerator: Generating for: {description}")
+
+        system_prompt, user_prompt = self._prompts(description)
+        success, llm_output = get_cached_llm_response(self.llm_client, system_prompt, user_prompt, semantic=False)
+        return self._build_plan(description, success, llm_output)
 
+    def _build_plan(self, description: str, success: bool, llm_output) -> dict:
+        """Turns the LLM response into the build plan."""
         if not success:
             print(f"RedstoneLampCircuitGenerator: LLM call failed. Response: {llm_output}")
             return { "description": description, "blocks": [] }
@@ -68,38 +76,10 @@ Ensure the circuit is fully functional with proper signal flow and power distrib
             print(f"RedstoneLampCircuitGenerator: Failed to extract a valid list from LLM. Response: {llm_output}")
             return { "description": description, "blocks": [] }
         
-        actual_block_commands = []
-        for component_task in llm_output:
-            blocks = generate_blocks_from_task(component_task)
-            actual_block_commands.extend(blocks)
-
-        min_x, min_y, min_z = float('inf'), float('inf'), float('inf')
-        max_x, max_y, max_z = float('-inf'), float('-inf'), float('-inf')
-
-        if actual_block_commands:
-            for block in actual_block_commands:
-                min_x = min(min_x, block['x'])
-                min_y = min(min_y, block['y'])
-                min_z = min(min_z, block['z'])
-                max_x = max(max_x, block['x'])
-                max_y = max(max_y, block['y'])
-                max_z = max(max_z, block['z'])
-            
-            width = max_x - min_x + 1
-            height = max_y - min_y + 1
-            depth = max_z - min_z + 1
-        else:
-            min_x, min_y, min_z = 0, 0, 0
-            max_x, max_y, max_z = 0, 0, 0
-            width, height, depth = 0, 0, 0
-
-        spatial_metadata = {
-            "bounding_box": {
-                "min_x": min_x, "min_y": min_y, "min_z": min_z,
-                "max_x": max_x, "max_y": max_y, "max_z": max_z
-            },
-            "dimensions": {"width": width, "height": height, "depth": depth}
-        }
+        block_columns, bbox = generate_columns_with_bbox(processed_output)
+
+        # 边界框在展开图元时已经累计好
+        spatial_metadata = compute_spatial_metadata(bbox=bbox)
 
         final_generated_structure = {
             "design_components": llm_output,
@@ -109,7 +89,7 @@ Ensure the circuit is fully functional with proper signal flow and power distrib
         build_plan = {
             "description": description,
             "generated_structure": final_generated_structure,
-            "blocks": actual_block_commands
+            "blocks": block_columns
         }
         
         return build_plan
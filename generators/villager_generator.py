@@ -1,4 +1,5 @@
 import os
+import re
 import sys
 import json
 import argparse
@@ -7,11 +8,52 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, write_json_file
+from src.util import get_llm_client, get_cached_llm_response, write_json_file
 from src.key_manager import get_next_api_key
 
 BUILD_DIR = os.path.join(current_dir, '../build')
 
+# 描述中的坐标，例如 "(10, 64, 10)"，也接受全角括号和逗号
+COORDINATE_PATTERN = re.compile(r'[(（]\s*(-?\d+)\s*[,，]\s*(-?\d+)\s*[,，]\s*(-?\d+)\s*[)）]')
+
+# 职业的中英文名称 -> Minecraft 村民职业ID
+PROFESSION_NAMES = {
+    'farmer': 'farmer', '农民': 'farmer', '农夫': 'farmer',
+    'librarian': 'librarian', '图书管理员': 'librarian',
+    'armorer': 'armorer', '盔甲匠': 'armorer',
+    'butcher': 'butcher', '屠夫': 'butcher',
+    'cartographer': 'cartographer', '制图师': 'cartographer',
+    'cleric': 'cleric', '牧师': 'cleric',
+    'fisherman': 'fisherman', '渔夫': 'fisherman',
+    'fletcher': 'fletcher', '制箭师': 'fletcher',
+    'leatherworker': 'leatherworker', '皮匠': 'leatherworker',
+    'mason': 'mason', '石匠': 'mason',
+    'shepherd': 'shepherd', '牧羊人': 'shepherd',
+    'toolsmith': 'toolsmith', '工具匠': 'toolsmith',
+    'weaponsmith': 'weaponsmith', '武器匠': 'weaponsmith',
+    'nitwit': 'nitwit', '傻子': 'nitwit',
+}
+PROFESSION_PATTERN = re.compile(
+    '|'.join(sorted(map(re.escape, PROFESSION_NAMES), key=len, reverse=True)), re.IGNORECASE)
+
+# 固定的 system prompt：每次请求的前缀完全相同，便于服务端复用提示缓存
+SYSTEM_PROMPT = """你是一个Minecraft实体生成设计师。你的任务是根据用户的描述，设计一个Minecraft村民的生成位置和职业，并输出一个JSON对象。这个JSON对象应该包含'x'、'y'、'z'坐标和'profession'字段。
+
+示例输出:
+```json
+{
+  "x": 10,
+  "y": 64,
+  "z": 10,
+  "profession": "farmer"
+}
+```
+
+重要提示:
+1.  所有坐标都是相对坐标，以(0,0,0)为基准。
+2.  'profession'必须是有效的Minecraft村民职业ID，例如'farmer'、'librarian'、'armorer'等。
+3.  请严格按照JSON对象格式返回，不要包含任何额外说明或代码块标记。"""
+
 class VillagerGenerator:
     """
     村民生成器 - 负责在指定位置生成村民，可指定职业。
@@ -19,6 +61,24 @@ class VillagerGenerator:
     def __init__(self, llm_client):
         self.llm_client = llm_client
 
+    @staticmethod
+    def _parse_description(description: str):
+        """
+        描述中同时写明了坐标和职业时（例如 "在(10, 64, 10)生成一个农民村民"）直接解析出结果，
+        不必请求LLM；否则返回 None。
+        """
+        coordinates = COORDINATE_PATTERN.search(description)
+        profession = PROFESSION_PATTERN.search(description)
+        if not coordinates or not profession:
+            return None
+        x, y, z = map(int, coordinates.groups())
+        return {"x": x, "y": y, "z": z, "profession": PROFESSION_NAMES[profession.group(0).lower()]}
+
+    def _prompts(self, description: str):
+        """构造发送给LLM的 (system_prompt, user_prompt)。"""
+        user_prompt = f"生成一个Minecraft村民：{description}"
+        return SYSTEM_PROMPT, user_prompt
+
     def generate(self, description: str) -> dict:
         """
         根据描述生成村民。
@@ -29,33 +89,24 @@ class VillagerGenerator:
         """
         print(f"VillagerGenerator: Generating villager for description: {description}")
 
-        system_prompt = """你是一个Minecraft实体生成设计师。你的任务是根据用户的描述，设计一个Minecraft村民的生成位置和职业，并输出一个JSON对象。这个JSON对象应该包含'x'、'y'、'z'坐标和'profession'字段。
-
-示例输出:
-```json
-{
-  "x": 10,
-  "y": 64,
-  "z": 10,
-  "profession": "farmer"
-}
-```
+        parsed = self._parse_description(description)
+        if parsed:
+            print("VillagerGenerator: Parsed coordinates and profession from the description, skipping LLM.")
+            return self._build_plan(description, True, parsed)
 
-重要提示:
-1.  所有坐标都是相对坐标，以(0,0,0)为基准。
-2.  'profession'必须是有效的Minecraft村民职业ID，例如'farmer'、'librarian'、'armorer'等。
-3.  请严格按照JSON对象格式返回，不要包含任何额外说明或代码块标记。"""    
-        user_prompt = f"生成一个Minecraft村民：{description}"
+        system_prompt, user_prompt = self._prompts(description)
         print(f"VillagerGenerator: Sending prompt to LLM: {user_prompt}")
+        success, llm_output = get_cached_llm_response(self.llm_client, system_prompt, user_prompt, semantic=False)
+        return self._build_plan(description, success, llm_output)
 
-        success, llm_output = get_llm_response(self.llm_client, system_prompt, user_prompt)
-
+    def _build_plan(self, description: str, success: bool, llm_output) -> dict:
+        """把LLM响应转换为建造蓝图。"""
         if not success:
             print(f"VillagerGenerator: Error from LLM: {llm_output}")
             return {"description": description, "generated_structure": {}, "blocks": []}
         
         generated_villager_data = llm_output
-        print(f"VillagerGenerator: Received LLM output: {generated_villager_data}")
+        print(f"VillagerGenerator: Villager data: {generated_villager_data}")
 
         actual_block_commands = []
         # For now, we place a placeholder block at the villager's location.
@@ -0,0 +1,34 @@
+# src/bbox_kernel.py
+# 边界框和坐标打包的 Numba 内核。本模块只在方块数量很大时由 util.compute_bbox 和 util._pack_coords 按需导入，
+# 避免每个生成器进程都承担导入 numba 的开销。
+# pack_coords_kernel 是并行内核，调用方需持有 util._numba_parallel_lock，见 util 中的说明。
+import numpy as np
+from numba import njit, prange
+
+@njit(cache=True)
+def bbox_kernel(coords):
+    """一次遍历 (N, 3) 坐标数组同时求出每个轴的最小值和最大值，不产生中间数组。"""
+    mins = coords[0].copy()
+    maxs = coords[0].copy()
+    for i in range(1, coords.shape[0]):
+        for k in range(3):
+            v = coords[i, k]
+            if v < mins[k]:
+                mins[k] = v
+            elif v > maxs[k]:
+                maxs[k] = v
+    return mins, maxs
+
+@njit(cache=True, parallel=True)
+def pack_coords_kernel(coords, mins):
+    """
+    把 (N, 3) 坐标相对 mins 平移后按每轴 21 位打包成 int64 键，与 util._pack_coords 的结果相同。
+    各行互不依赖，用 prange 在多个线程上并行，平移、打包融合在一次遍历中完成，不产生中间数组。
+    """
+    n = coords.shape[0]
+    keys = np.empty(n, dtype=np.int64)
+    for i in prange(n):
+        keys[i] = ((np.int64(coords[i, 0] - mins[0]) << 42) |
+                   (np.int64(coords[i, 1] - mins[1]) << 21) |
+                   np.int64(coords[i, 2] - mins[2]))
+    return keys
@@ -0,0 +1,162 @@
+# src/command_queue.py
+import os
+import sys
+import json
+import threading
+import contextlib
+
+# 将根目录添加到 sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, '..'))
+
+from src.util import json_loads, json_dumps
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    # 未安装 watchdog 时退回按修改时间轮询
+    Observer = None
+    FileSystemEventHandler = object
+
+# ==============================================================================
+#                             建造指令队列
+# ==============================================================================
+# 监听器 (mc_listener.py) 把玩家的 !build 指令追加到 command_queue.jsonl，总规划师从队首取出。
+# 队列文件每行一条指令 (JSON Lines)：追加只在文件末尾写一行，不必读取和重写整个队列；
+# 所有读写都在同一把文件锁内完成，不会互相覆盖对方刚写入的指令；
+# 总规划师通过文件系统事件得知队列有变化，空闲时不再每秒读取并解析一次队列文件。
+
+QUEUE_PATH = os.path.join(current_dir, '../command_queue.jsonl')
+LOCK_PATH = QUEUE_PATH + '.lock'
+
+# 没有 watchdog 时检查队列文件修改时间的间隔 (秒)；每次检查只是一次 stat，间隔可以很短
+POLL_INTERVAL = 0.2
+
+@contextlib.contextmanager
+def _queue_lock():
+    """在锁文件上加排他锁，保护队列文件的读-改-写。"""
+    fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+def _read_lines():
+    try:
+        with open(QUEUE_PATH, 'rb') as f:
+            return f.read().splitlines(keepends=True)
+    except FileNotFoundError:
+        return []
+
+def _write_lines(lines):
+    with open(QUEUE_PATH, 'wb') as f:
+        f.write(b''.join(lines))
+
+def append_request(request):
+    """把一条指令作为一行追加到队尾。"""
+    with _queue_lock():
+        with open(QUEUE_PATH, 'ab') as f:
+            f.write(json_dumps(request) + b'\n')
+
+def push_front(request):
+    """把一条指令放回队首，下一轮优先处理。"""
+    with _queue_lock():
+        _write_lines([json_dumps(request) + b'\n'] + _read_lines())
+
+def pop_request():
+    """
+    取出队首的指令；队列为空时返回 None。只解析取出的那一行，其余行原样写回。
+    没有取出任何一行时不写文件，否则这次写入会立即唤醒等待队列变化的 QueueWatcher。
+    """
+    with _queue_lock():
+        lines = _read_lines()
+        removed = False
+        while lines:
+            line = lines.pop(0)
+            removed = True
+            if not line.strip():
+                continue
+            _write_lines(lines)
+            try:
+                return json_loads(line)
+            except json.JSONDecodeError as e:
+                print(f"队列中有无法解析的指令，已丢弃: {e}")
+        if removed:
+            # 只剩空行或无法解析的行，已全部丢弃
+            _write_lines(lines)
+        return None
+
+# 只关心写入类事件；读取队列时产生的 opened / closed_no_write 事件会让等待方被自己的读取唤醒
+_WRITE_EVENT_TYPES = {'created', 'modified', 'moved', 'closed'}
+
+class _QueueEventHandler(FileSystemEventHandler):
+    def __init__(self, changed):
+        self.changed = changed
+        self.queue_path = os.path.abspath(QUEUE_PATH)
+
+    def on_any_event(self, event):
+        if event.event_type not in _WRITE_EVENT_TYPES:
+            return
+        paths = (getattr(event, 'src_path', ''), getattr(event, 'dest_path', ''))
+        if any(path and os.path.abspath(path) == self.queue_path for path in paths):
+            self.changed.set()
+
+class QueueWatcher:
+    """
+    等待队列文件发生变化。安装了 watchdog 时由文件系统事件唤醒，几乎不占用CPU；
+    否则按 POLL_INTERVAL 检查文件修改时间，只做一次 stat，不读取文件内容。
+    """
+    def __init__(self):
+        self._changed = threading.Event()
+        self._observer = None
+        self._last_mtime = None
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_QueueEventHandler(self._changed), os.path.dirname(os.path.abspath(QUEUE_PATH)))
+            self._observer.daemon = True
+            self._observer.start()
+
+    def _mtime(self):
+        try:
+            return os.stat(QUEUE_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    def wait(self, timeout=None):
+        """阻塞直到队列文件在上次返回之后发生过变化，或超时；返回是否检测到变化。"""
+        if self._observer is not None:
+            changed = self._changed.wait(timeout)
+            self._changed.clear()
+            return changed
+
+        waited = 0.0
+        while timeout is None or waited < timeout:
+            mtime = self._mtime()
+            if mtime != self._last_mtime:
+                self._last_mtime = mtime
+                return True
+            self._changed.wait(POLL_INTERVAL)
+            waited += POLL_INTERVAL
+        return False
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
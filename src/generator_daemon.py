@@ -0,0 +1,142 @@
+# src/generator_daemon.py
+import os
+import sys
+import json
+import socket
+import asyncio
+import inspect
+import tempfile
+import threading
+import importlib.util
+import traceback
+
+# 将根目录添加到 sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, '..'))
+
+from src.util import get_llm_client, write_json_file, warm_up_shape_kernels, enable_prefetch
+from src.key_manager import get_next_api_key
+
+# ==============================================================================
+#                             常驻生成器服务
+# ==============================================================================
+# 每次以子进程运行 generators/xxx.py 都要重新启动解释器、导入 numpy/openai 并建立新的 TLS 连接。
+# 本服务常驻运行，在同一个进程里复用已导入的生成器模块和 LLM 客户端；
+# 总规划师在套接字存在时把子任务发给本服务，否则仍旧启动子进程。
+#
+# 协议：客户端发送一行 JSON {"generator": "xxx.py", "name": ..., "prompt": ...}，
+# 服务在 build 目录写好蓝图后回复一行 JSON {"ok": true, "file": 路径} 或 {"ok": false, "error": 信息}。
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'mcbuild.sock')
+BUILD_DIR = os.path.join(current_dir, '../build')
+GENERATORS_DIR = os.path.join(current_dir, '../generators')
+
+# 生成器脚本路径 -> (修改时间, 生成器类)；脚本被修改或新建时重新导入
+_generator_classes = {}
+
+def daemon_available():
+    """当前平台支持 Unix 套接字且服务正在运行时返回 True。"""
+    return hasattr(socket, 'AF_UNIX') and os.path.exists(SOCKET_PATH)
+
+def is_valid_generator_name(generator):
+    """
+    只接受 generators 目录下形如 xxx_generator.py 的文件名。生成器名由客户端提供，
+    带目录、绝对路径或 .. 的名字会让服务导入任意位置的 Python 代码。
+    """
+    return (isinstance(generator, str) and generator.endswith('_generator.py')
+            and os.path.basename(generator) == generator and '/' not in generator and '\\' not in generator)
+
+def _load_generator_class(generator_script):
+    """导入生成器脚本并返回其中定义的、带有 generate 方法的类。"""
+    mtime = os.path.getmtime(generator_script)
+    cached = _generator_classes.get(generator_script)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    module_name = os.path.splitext(os.path.basename(generator_script))[0]
+    spec = importlib.util.spec_from_file_location(module_name, generator_script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__ == module_name and callable(getattr(cls, 'generate', None)):
+            _generator_classes[generator_script] = (mtime, cls)
+            return cls
+    raise ValueError(f"生成器脚本 {generator_script} 中没有找到带 generate 方法的类。")
+
+def _run_generator(generator, name, prompt):
+    """与生成器脚本的 __main__ 相同：生成蓝图并写入 build 目录，返回文件路径。"""
+    if not is_valid_generator_name(generator):
+        raise ValueError(f"无效的生成器脚本名 '{generator}'")
+    generator_script = os.path.join(GENERATORS_DIR, generator)
+    if not os.path.exists(generator_script):
+        raise FileNotFoundError(f"找不到生成器脚本 '{generator}'")
+    generator_class = _load_generator_class(generator_script)
+
+    llm_client = get_llm_client(get_next_api_key())
+    build_plan = generator_class(llm_client).generate(prompt)
+
+    output_filename = f"{name}_{os.path.splitext(generator)[0]}.json"
+    output_filepath = os.path.join(BUILD_DIR, output_filename)
+    write_json_file(output_filepath, build_plan)
+    return output_filepath
+
+async def _handle_client(reader, writer):
+    try:
+        request = json.loads(await reader.readline())
+        print(f"生成器服务：收到任务 {request.get('generator')} ({request.get('name')})")
+        # 生成器是同步代码，放到线程中运行，多个任务之间的LLM请求可以相互重叠
+        output_filepath = await asyncio.to_thread(
+            _run_generator, request['generator'], request['name'], request['prompt'])
+        reply = {"ok": True, "file": output_filepath}
+        print(f"生成器服务：已保存蓝图 {output_filepath}")
+    except Exception as e:
+        traceback.print_exc()
+        reply = {"ok": False, "error": str(e)}
+    writer.write(json.dumps(reply, ensure_ascii=False).encode('utf-8') + b'\n')
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+async def request_generation(generator, name, prompt):
+    """把一个子任务发给生成器服务并等待完成，返回 (是否成功, 文件路径或错误信息)。"""
+    reader, writer = await asyncio.open_unix_connection(SOCKET_PATH)
+    try:
+        request = {"generator": generator, "name": name, "prompt": prompt}
+        writer.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        await writer.drain()
+        line = await reader.readline()
+    finally:
+        writer.close()
+    if not line:
+        # 服务在处理过程中退出，连接被关闭
+        raise ConnectionError("生成器服务在返回结果前断开了连接")
+    reply = json.loads(line)
+    if reply.get('ok'):
+        return True, reply['file']
+    return False, reply.get('error', '未知错误')
+
+async def serve():
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)  # 上次异常退出遗留的套接字文件
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    # 服务常驻运行，生成器发出的预取请求来得及完成并写入缓存
+    enable_prefetch()
+    # 后台提前编译形状内核，第一个大型建筑不必等待编译
+    threading.Thread(target=warm_up_shape_kernels, daemon=True).start()
+    server = await asyncio.start_unix_server(_handle_client, path=SOCKET_PATH)
+    print(f"生成器服务已启动，监听 {SOCKET_PATH}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+
+if __name__ == "__main__":
+    if not hasattr(socket, 'AF_UNIX'):
+        print("当前平台不支持 Unix 套接字，无法启动生成器服务；总规划师会继续以子进程运行生成器。")
+        sys.exit(1)
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("生成器服务已停止。")
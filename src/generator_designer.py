@@ -1,6 +1,8 @@
 import os
+import re
 import sys
 import json
+import functools
 
 # Add root directory to sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,6 +14,33 @@ PROMPT_TEMPLATE_PATH = os.path.join(current_dir, '../generator_designer_prompt_f
 SCRIPT_TEMPLATE_PATH = os.path.join(current_dir, './generator_template.py.txt')
 GENERATORS_DIR = os.path.join(current_dir, '../generators')
 
+# Matches the ##NAME## placeholders in the script template
+PLACEHOLDER_PATTERN = re.compile(r'##(\w+)##')
+
+# Schema of the placeholder values the LLM fills in; requested in JSON mode so the reply is always a JSON object
+PLACEHOLDER_SCHEMA = {
+    "type": "object",
+    "required": ["CLASS_NAME", "DOCSTRING", "SYSTEM_PROMPT", "GENERATOR_LOGIC"],
+    "properties": {
+        "CLASS_NAME": {"type": "string"},
+        "DOCSTRING": {"type": "string"},
+        "SYSTEM_PROMPT": {"type": "string"},
+        "GENERATOR_LOGIC": {"type": "string"},
+    },
+}
+
+@functools.lru_cache(maxsize=8)
+def _read_template(path, mtime):
+    """Reads a template file; the modification time is part of the cache key so edits are picked up."""
+    return read_file_content(path)
+
+def _load_template(path):
+    """Returns the cached content of a template file, or None if it cannot be read."""
+    try:
+        return _read_template(path, os.path.getmtime(path))
+    except OSError:
+        return None
+
 class GeneratorDesigner:
     """
     The Generator Designer dynamically creates new generator scripts by filling in a template.
@@ -33,8 +62,8 @@ class GeneratorDesigner:
         print(f"GeneratorDesigner: Received task to create '{generator_name}.py' using fill-in-the-blank method.")
 
         # 1. Read the prompt and script templates
-        prompt_template = read_file_content(PROMPT_TEMPLATE_PATH)
-        script_template = read_file_content(SCRIPT_TEMPLATE_PATH)
+        prompt_template = _load_template(PROMPT_TEMPLATE_PATH)
+        script_template = _load_template(SCRIPT_TEMPLATE_PATH)
         if not prompt_template or not script_template:
             return False, "Error: Could not read prompt or script templates."
 
@@ -44,23 +73,19 @@ class GeneratorDesigner:
         print("GeneratorDesigner: Sending request to LLM to fill in the blanks...")
         # 3. Call the LLM to get the placeholder values
         # The system prompt is simple as the main instructions are in the user prompt
-        success, response_json = get_llm_response(self.llm_client, "You are a code-filling assistant.", final_prompt, expect_json=True)
+        # JSON mode guarantees a parseable object; the required keys are checked against PLACEHOLDER_SCHEMA
+        success, response_json = get_llm_response(self.llm_client, "You are a code-filling assistant.", final_prompt,
+                                                  expect_json=True, response_schema=PLACEHOLDER_SCHEMA)
 
         if not success:
             return False, f"Error: LLM failed to provide placeholder values. Details: {response_json}"
 
-        # 4. Validate the received JSON
-        required_keys = ["CLASS_NAME", "DOCSTRING", "SYSTEM_PROMPT", "GENERATOR_LOGIC"]
-        if not all(key in response_json for key in required_keys):
-            return False, f"Error: LLM response was missing one or more required keys. Response: {response_json}"
-
-        # 5. Fill in the template
-        final_script_code = script_template.replace("##CLASS_NAME##", response_json["CLASS_NAME"])
-        final_script_code = final_script_code.replace("##DOCSTRING##", response_json["DOCSTRING"])
-        final_script_code = final_script_code.replace("##SYSTEM_PROMPT##", response_json["SYSTEM_PROMPT"])
-        final_script_code = final_script_code.replace("##GENERATOR_LOGIC##", response_json["GENERATOR_LOGIC"])
+        # 4. Fill in the template
+        # Single pass over the template; unknown placeholders are left as they are
+        final_script_code = PLACEHOLDER_PATTERN.sub(
+            lambda m: str(response_json.get(m.group(1), m.group(0))), script_template)
 
-        # 6. Save the new script
+        # 5. Save the new script
         output_path = os.path.join(GENERATORS_DIR, f"{generator_name}.py")
         try:
             with open(output_path, 'w', encoding='utf-8') as f:
@@ -2,38 +2,84 @@
 import json
 import os
 import sys
+import struct
+import functools
 
 # 确保可以从父目录导入模块
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import read_json_file, write_json_file
+from src.util import read_json_file
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
 
 API_KEYS_LIST_PATH = os.path.join(current_dir, '../config/api_keys_list.json')
 KEY_STATE_PATH = os.path.join(current_dir, '../config/key_state.json')
+# 8 字节的轮换计数器，多个生成器进程通过文件锁共享
+KEY_COUNTER_PATH = os.path.join(current_dir, '../config/key_state.counter')
+
+@functools.lru_cache(maxsize=4)
+def _load_api_keys(mtime):
+    """读取API密钥列表；以文件修改时间作为缓存键，密钥列表被修改后会重新读取。"""
+    return read_json_file(API_KEYS_LIST_PATH)
+
+def _lock(fd):
+    if os.name == 'nt':
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 8)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+def _unlock(fd):
+    if os.name == 'nt':
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 8)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+def _initial_counter():
+    """计数器文件不存在时，从旧的 key_state.json 接着轮换。"""
+    state = read_json_file(KEY_STATE_PATH)
+    if state and 'last_used_index' in state:
+        return state['last_used_index'] + 1
+    return 0
+
+def _fetch_and_increment():
+    """在文件锁保护下把计数器加一，返回加一之前的值。多个进程同时调用时每个值只会被取到一次。"""
+    fd = os.open(KEY_COUNTER_PATH, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        _lock(fd)
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            data = os.read(fd, 8)
+            value = struct.unpack('<Q', data)[0] if len(data) == 8 else _initial_counter()
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, struct.pack('<Q', value + 1))
+            return value
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
 
 def get_next_api_key():
     """
     从列表中循环获取下一个API密钥。
-    通过读写 key_state.json 来跟踪上一个使用的密钥索引。
+    密钥列表在进程内缓存；轮换位置保存在一个 8 字节的计数器文件中，每次调用只做一次加锁的读写。
     """
     # 1. 加载所有可用的API密钥
-    api_keys = read_json_file(API_KEYS_LIST_PATH)
+    try:
+        api_keys = _load_api_keys(os.path.getmtime(API_KEYS_LIST_PATH))
+    except OSError:
+        api_keys = None
     if not api_keys:
         raise ValueError(f"API密钥列表为空或不存在于 {API_KEYS_LIST_PATH}")
 
-    # 2. 加载上一次使用的密钥索引
-    state = read_json_file(KEY_STATE_PATH)
-    last_index = -1
-    if state and 'last_used_index' in state:
-        last_index = state['last_used_index']
-
-    # 3. 计算下一个要使用的密钥索引（循环）
-    next_index = (last_index + 1) % len(api_keys)
-
-    # 4. 更新并保存状态
-    write_json_file(KEY_STATE_PATH, {'last_used_index': next_index})
+    # 2. 原子地推进计数器，计算本次使用的密钥索引（循环）
+    next_index = _fetch_and_increment() % len(api_keys)
 
-    # 5. 返回下一个密钥
+    # 3. 返回下一个密钥
     print(f"密钥管理器：正在使用索引为 {next_index} 的密钥。")
     return api_keys[next_index]
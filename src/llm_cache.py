@@ -0,0 +1,167 @@
+# src/llm_cache.py
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    # 未安装 orjson 时退回标准库 json
+    orjson = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    # 未安装 sentence-transformers 时只做精确匹配
+    SentenceTransformer = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# ==============================================================================
+#                             LLM 响应语义缓存
+# ==============================================================================
+# 缓存按 system prompt 分区：只有 system prompt 完全相同的请求才会互相命中，
+# 分区内再比较 user prompt 的向量余弦相似度，超过阈值即复用之前的响应。
+# 语义匹配只在句向量模型成功载入时进行；字符级的相似度无法区分 "red roof" 与 "blue roof"、
+# "nether portal" 与 "end portal" 这类只差一个词的描述，没有模型时只按 prompt 精确匹配。
+# 调用方应只把用户的描述作为 prompt 传入（见 util.get_cached_llm_response 的 cache_prompt），
+# 共用的前缀会让不同的描述在向量上也显得相近。
+
+CACHE_PATH = os.path.join(current_dir, '../build/.llm_cache.sqlite')
+SIMILARITY_THRESHOLD = 0.95
+EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+def _loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def _dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False)
+
+def _numbers_key(text):
+    """提取文本中的全部数字。语义相近但尺寸、坐标不同的描述（如 10x10 与 20x20 的院子）不能共用响应。"""
+    return tuple(_NUMBER_PATTERN.findall(text))
+
+class GenerativeCache:
+    """
+    持久化在 SQLite 中的 LLM 响应缓存，先按 user prompt 精确匹配，句向量模型可用时再按向量相似度匹配。
+    每个分区的向量在首次查询时载入内存，之后的查询只是一次矩阵乘法。
+    """
+    def __init__(self, path=CACHE_PATH, threshold=SIMILARITY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = None
+        self._model = None  # None: 尚未载入; False: 模型不可用，只做精确匹配
+        self.embedder = f"st:{EMBEDDING_MODEL}"
+        # 分区键 -> (向量矩阵, 对应的响应JSON文本列表, 对应 prompt 中的数字, 写入时间数组)
+        self._index = {}
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    namespace TEXT NOT NULL,
+                    embedder TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (namespace, embedder, prompt)
+                )""")
+            self._conn.commit()
+        return self._conn
+
+    def _get_model(self):
+        if self._model is None:
+            self._model = False
+            if SentenceTransformer is not None:
+                try:
+                    self._model = SentenceTransformer(EMBEDDING_MODEL)
+                except Exception as e:
+                    print(f"载入句向量模型失败，LLM缓存只做精确匹配: {e}")
+        return self._model or None
+
+    @property
+    def semantic_available(self):
+        """句向量模型是否可用；不可用时 lookup 只做精确匹配。"""
+        return self._get_model() is not None
+
+    def _embed(self, text):
+        """返回文本的句向量；模型不可用时返回 None。"""
+        model = self._get_model()
+        if model is None:
+            return None
+        return np.asarray(model.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+    @staticmethod
+    def _namespace(partition):
+        return hashlib.sha256(partition.encode('utf-8')).hexdigest()
+
+    def _load_index(self, namespace):
+        if namespace not in self._index:
+            rows = self._connect().execute(
+                "SELECT embedding, response, prompt, created FROM llm_cache WHERE namespace = ? AND embedder = ?",
+                (namespace, self.embedder)).fetchall()
+            # 模型不可用时写入的条目没有向量，不参与语义匹配
+            rows = [row for row in rows if row[0]]
+            if rows:
+                vectors = np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+            else:
+                vectors = np.empty((0, 0), dtype=np.float32)
+            self._index[namespace] = (vectors, [row[1] for row in rows], [_numbers_key(row[2]) for row in rows],
+                                      np.array([row[3] for row in rows], dtype=np.float64))
+        return self._index[namespace]
+
+    def lookup(self, partition, prompt, semantic=True, max_age=None):
+        """
+        返回 (是否命中, 缓存的响应)。每次命中都重新解析JSON，调用方可以放心修改返回值。
+        semantic=False 或句向量模型不可用时只做精确匹配；max_age (秒) 不为空时忽略比它更早写入的条目。
+        """
+        namespace = self._namespace(partition)
+        oldest = time.time() - max_age if max_age is not None else float('-inf')
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT response FROM llm_cache WHERE namespace = ? AND embedder = ? AND prompt = ? AND created >= ?",
+                (namespace, self.embedder, prompt, oldest)).fetchone()
+            if row:
+                return True, _loads(row[0])
+            if not semantic or not self.semantic_available:
+                return False, None
+
+            vectors, responses, numbers, created = self._load_index(namespace)
+            # 语义匹配只在 prompt 中的数字完全相同且未过期的条目之间进行
+            numbers_key = _numbers_key(prompt)
+            candidates = [i for i, key in enumerate(numbers) if key == numbers_key and created[i] >= oldest]
+            if not candidates:
+                return False, None
+            similarities = vectors[candidates] @ self._embed(prompt)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return True, _loads(responses[candidates[best]])
+        return False, None
+
+    def store(self, partition, prompt, response, semantic=True):
+        """保存一条成功的响应；semantic=False 的条目只用于精确匹配，不计算向量。"""
+        namespace = self._namespace(partition)
+        response_text = _dumps(response)
+        with self._lock:
+            vector = self._embed(prompt) if semantic else None
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, self.embedder, prompt, vector.tobytes() if vector is not None else b'',
+                 response_text, time.time()))
+            conn.commit()
+            # 使内存中的分区失效，下次查询时从数据库重新载入
+            self._index.pop(namespace, None)
@@ -1,42 +1,61 @@
 # src/main_planner.py
 import os
 import sys
+import atexit
+import asyncio
 import time
 import json
 import subprocess
 import re
+import threading
 import traceback
+import numpy as np
 
 # 将根目录添加到 sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..'))
 
-from src.util import get_llm_client, get_llm_response, read_json_file, write_json_file
+from src.util import get_llm_client, get_cached_llm_response, semantic_cache_available, enable_prefetch, read_json_file, write_json_file, BlockBuffer, blocks_to_columns, warm_up_shape_kernels
 from src.rcon_client import get_rcon_client, RconClient
 from src.key_manager import get_next_api_key
 from src.generator_designer import GeneratorDesigner
+from src.generator_daemon import daemon_available, is_valid_generator_name, request_generation
+from src.command_queue import QueueWatcher, pop_request, push_front
+from generators import get_generator_class
 
-COMMAND_QUEUE_FILE = os.path.join(current_dir, '../command_queue.json')
 BUILD_DIR = os.path.join(current_dir, '../build')
 GENERATORS_DIR = os.path.join(current_dir, '../generators')
 FINAL_PLAN_FILE = os.path.join(current_dir, '../final_build_plan.json')
 
+# 路由决策的缓存有效期 (秒)：生成器脚本本身没有变化时，一天内相同或相近的请求直接复用之前的决策
+ROUTE_CACHE_MAX_AGE = 24 * 60 * 60
+
+# 同时运行的生成器进程数上限，避免瞬间向LLM接口发出过多请求
+MAX_PARALLEL_GENERATORS = 4
+
+# (generators 目录的修改时间, 扫描结果)；只有增删文件时目录的修改时间才会变化
+_generators_cache = (None, [])
+
 def get_available_generators() -> list[str]:
-    """扫描 generators 目录，返回所有可用的 .py 生成器脚本列表。"""
-    if not os.path.exists(GENERATORS_DIR):
+    """
+    扫描 generators 目录，返回所有可用的 .py 生成器脚本列表（按文件名排序，路由提示词保持稳定）。
+    目录的修改时间没有变化时直接返回上次的结果，只做一次 stat。
+    """
+    global _generators_cache
+    try:
+        mtime = os.stat(GENERATORS_DIR).st_mtime_ns
+    except FileNotFoundError:
         return []
-    return [f for f in os.listdir(GENERATORS_DIR) if f.endswith('.py') and not f.startswith('__')]
-
-def route_request(client, user_prompt: str, available_generators: list[str]) -> dict:
-    """智能路由：决定是分解任务还是设计新生成器。"""
-    generator_list_str = "\n- ".join(available_generators)
-    
-    system_prompt = f"""You are a master controller for a Minecraft AI builder. Your primary function is to analyze a user's request and determine the best course of action based on a list of available tools (generator scripts).
+    if _generators_cache[0] != mtime:
+        scripts = sorted(f for f in os.listdir(GENERATORS_DIR) if f.endswith('.py') and not f.startswith('__'))
+        _generators_cache = (mtime, scripts)
+    return list(_generators_cache[1])
 
-Available Tools:
-- {generator_list_str}
+# 路由的 system prompt 不含任何随请求变化的内容，每次请求的前缀完全相同，便于 DeepSeek 复用提示缓存；
+# 可用生成器列表放在 user prompt 开头
+ROUTE_SYSTEM_PROMPT = """You are a master controller for a Minecraft AI builder. Your primary function is to analyze a user's request and determine the best course of action based on a list of available tools (generator scripts).
 
-Based on the user's request, you have two choices:
+Based on the user's request and the list of available tools given in the user message, you have two choices:
 
 1.  **run_existing_generators**: If the available tools are sufficient to fulfill the request, decompose the request into a JSON array of sub-tasks. Each task object must have `generator`, `name`, and `task` fields.
 
@@ -48,40 +67,53 @@ Based on the user's request, you have two choices:
 User Request: "Build a small wooden house with a garden."
 Your JSON Response:
 ```json
-{{
+{
   "action": "run_existing_generators",
   "sub_tasks": [
-    {{
+    {
       "generator": "building_generator.py",
       "name": "small_house",
       "task": "A small wooden house with a door and windows."
-    }},
-    {{
+    },
+    {
       "generator": "garden_generator.py",
       "name": "house_garden",
       "task": "A simple garden with some flowers and a path."
-    }}
+    }
   ]
-}}
+}
 ```
 
 **Example 2: Designing a new tool**
 User Request: "Build a giant futuristic portal to another dimension."
 Your JSON Response:
 ```json
-{{
+{
   "action": "design_new_generator",
-  "new_generator_request": {{
+  "new_generator_request": {
     "description": "A generator capable of creating sci-fi and futuristic portals with glowing effects and complex geometric shapes.",
     "suggested_name": "portal_generator"
-  }}
-}}
+  }
+}
 ```
 """
-    
-    user_prompt_for_llm = f"User Request: \"{user_prompt}\""
+
+def _is_cacheable_route(decision):
+    return isinstance(decision, dict) and decision.get('action') == 'run_existing_generators'
+
+def route_request(client, user_prompt: str, available_generators: list[str]) -> dict:
+    """智能路由：决定是分解任务还是设计新生成器。"""
+    generator_list_str = "\n- ".join(available_generators)
+    request_line = f"User Request: \"{user_prompt}\""
+    user_prompt_for_llm = f"Available Tools:\n- {generator_list_str}\n\n{request_line}"
     print("总规划师：正在请求路由决策...")
-    success, response = get_llm_response(client, system_prompt, user_prompt_for_llm)
+    # 生成器列表并入缓存分区，新增生成器后不会复用过时的决策；语义匹配只比较玩家的请求本身，
+    # 且只在有句向量模型时进行，否则只复用完全相同的请求的决策。
+    # 设计新生成器的决策不缓存：设计完成后重新路由时必须看到新的生成器，而覆盖已有脚本时生成器列表并不变化
+    success, response = get_cached_llm_response(client, ROUTE_SYSTEM_PROMPT, user_prompt_for_llm,
+                                                semantic=semantic_cache_available(), max_age=ROUTE_CACHE_MAX_AGE,
+                                                cache_context=generator_list_str, cache_prompt=request_line,
+                                                cache_if=_is_cacheable_route)
     
     if success:
         print(f"总规划师：成功获取路由决策: {response}")
@@ -102,18 +134,76 @@ def clear_build_directory():
     if os.path.exists(FINAL_PLAN_FILE):
         os.remove(FINAL_PLAN_FILE)
 
+def _run_in_process(generator_class, task):
+    """在本进程内运行已注册的生成器，与生成器脚本的 __main__ 相同：生成蓝图并写入 build 目录。"""
+    llm_client = get_llm_client(get_next_api_key())
+    build_plan = generator_class(llm_client).generate(task['task'])
+    output_filename = f"{task['name']}_{os.path.splitext(task['generator'])[0]}.json"
+    write_json_file(os.path.join(BUILD_DIR, output_filename), build_plan)
+
+async def _run_generator(task, cmd, semaphore):
+    """
+    在信号量限制下运行一个生成器子任务，返回退出码。
+    已注册的生成器 (generators.REGISTRY) 直接在本进程的线程中运行，共用已导入的模块和LLM连接池；
+    其余脚本交给常驻生成器服务，服务不可用时启动子进程。
+    """
+    async with semaphore:
+        try:
+            generator_class = get_generator_class(task['generator'])
+        except Exception as e:
+            print(f"总规划师：导入生成器 {task['generator']} 失败 ({e})，改为启动子进程。")
+            generator_class = None
+        if generator_class is not None:
+            print(f"总规划师：在本进程中运行生成器: {task['generator']} ({task['name']})")
+            try:
+                await asyncio.to_thread(_run_in_process, generator_class, task)
+                return 0
+            except Exception as e:
+                print(f"总规划师：生成器 {task['generator']} 运行失败: {e}")
+                traceback.print_exc()
+                return 1
+        if daemon_available() and is_valid_generator_name(task['generator']):
+            try:
+                print(f"总规划师：交给生成器服务: {task['generator']} ({task['name']})")
+                success, result = await request_generation(task['generator'], task['name'], task['task'])
+                if not success:
+                    print(f"总规划师：生成器服务执行 {task['generator']} 失败: {result}")
+                return 0 if success else 1
+            except (OSError, ValueError) as e:
+                # ValueError: 服务返回了无法解析的回复
+                print(f"总规划师：无法连接生成器服务 ({e})，改为启动子进程。")
+        print(f"总规划师：运行指令: {' '.join(cmd)}")
+        process = await asyncio.create_subprocess_exec(*cmd)
+        return await process.wait()
+
+async def _run_generator_tasks(tasks, cmds):
+    semaphore = asyncio.Semaphore(max(1, min(len(tasks), MAX_PARALLEL_GENERATORS)))
+    return await asyncio.gather(*(_run_generator(task, cmd, semaphore) for task, cmd in zip(tasks, cmds)))
+
 def run_generators(sub_tasks):
-    """执行所有生成器子任务。"""
+    """
+    执行所有生成器子任务。各子任务写入 build 目录中不同的文件、彼此独立，
+    因此并行运行（已注册的生成器在本进程内运行，其余交给常驻生成器服务 src/generator_daemon.py 或启动子进程），
+    让它们的LLM请求相互重叠。
+    """
     print("总规划师：正在启动生成器...")
+    tasks, cmds = [], []
     for task in sub_tasks:
         generator_script = os.path.join(GENERATORS_DIR, task['generator'])
         if not os.path.exists(generator_script):
             print(f"警告：找不到指定的生成器脚本 '{task['generator']}'，已跳过。")
             continue
-        
-        cmd = [sys.executable, "-X", "utf8", generator_script, '--name', task['name'], '--prompt', task['task']]
-        print(f"总规划师：运行指令: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
+        tasks.append(task)
+        cmds.append([sys.executable, "-X", "utf8", generator_script, '--name', task['name'], '--prompt', task['task']])
+
+    if not tasks:
+        print("总规划师：没有可运行的生成器。")
+        return
+    return_codes = asyncio.run(_run_generator_tasks(tasks, cmds))
+    # 任一生成器失败时仍像 check=True 一样抛出 CalledProcessError
+    for cmd, return_code in zip(cmds, return_codes):
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, cmd)
     print("总规划师：所有生成器执行完毕。")
 
 def run_supervisor(prompt):
@@ -138,7 +228,9 @@ def execute_final_plan(rcon_client: RconClient, player_name: str):
         return
     base_x, base_y, base_z = pos_result
 
-    final_block_list = []
+    # 第一遍读取各组件并转换为 BlockBuffer，得到方块总数；第二遍把平移后的坐标直接写入预分配的数组，
+    # 不再为每个组件生成中间的坐标数组后再整体拼接
+    parts = []
     for component_plan in final_plan:
         component_file = os.path.join(BUILD_DIR, component_plan['file_name'])
         component_data = read_json_file(component_file)
@@ -147,33 +239,50 @@ def execute_final_plan(rcon_client: RconClient, player_name: str):
             continue
         
         offset = component_plan.get('offset', {'x': 0, 'y': 0, 'z': 0})
-        for block in component_data.get('blocks', []):
-            final_block_list.append({
-                'x': int(base_x + offset.get('x', 0) + block['x']),
-                'y': int(base_y + offset.get('y', 0) + block['y']),
-                'z': int(base_z + offset.get('z', 0) + block['z']),
-                'block_type': block['block_type']
-            })
-    
-    print(f"总规划师：组装完成，总计 {len(final_block_list)} 个方块。准备施工！")
-    rcon_client.execute_build(final_block_list)
+        columns = blocks_to_columns(component_data.get('blocks', []))
+        translation = np.array([base_x + offset.get('x', 0), base_y + offset.get('y', 0), base_z + offset.get('z', 0)],
+                               dtype=np.float64)
+        parts.append((columns, translation))
+
+    total_blocks = sum(len(columns) for columns, _ in parts)
+    coords = np.empty((total_blocks, 3), dtype=np.int32)
+    type_ids = np.empty(total_blocks, dtype=np.uint16)
+    type_index = {}
+    start = 0
+    for columns, translation in parts:
+        end = start + len(columns)
+        # 赋值时 float64 到 int32 的转换与逐个 int() 相同，向零取整
+        coords[start:end] = columns.coords + translation
+        remap = np.array([type_index.setdefault(name, len(type_index)) for name in columns.type_table],
+                         dtype=np.uint16)
+        if len(remap):
+            type_ids[start:end] = remap[columns.type_ids]
+        start = end
+
+    final_columns = BlockBuffer(coords, type_ids, list(type_index))
+    print(f"总规划师：组装完成，总计 {len(final_columns)} 个方块。准备施工！")
+    rcon_client.execute_build(final_columns)
 
 def main_loop():
     """主事件循环。"""
     print("AI建筑总规划师已启动（动态进化架构）...")
     llm_client = get_llm_client(get_next_api_key())
     rcon_client = get_rcon_client()
+    atexit.register(rcon_client.close)
+    # 生成器在本进程内运行，进程常驻，预取的响应来得及写入缓存
+    enable_prefetch()
     designer = GeneratorDesigner(llm_client)
+    # 队列为空时等待队列文件的变化事件，而不是每秒读取一次
+    queue_watcher = QueueWatcher()
+    # 已注册的生成器在本进程内运行，后台提前编译形状内核，第一个大型建筑不必等待编译
+    threading.Thread(target=warm_up_shape_kernels, daemon=True).start()
 
     while True:
         try:
-            requests = read_json_file(COMMAND_QUEUE_FILE)
-            if not requests:
-                time.sleep(1)
+            request_data = pop_request()
+            if request_data is None:
+                queue_watcher.wait()
                 continue
-            
-            request_data = requests.pop(0)
-            write_json_file(COMMAND_QUEUE_FILE, requests)
 
             prompt = request_data['prompt']
             player_name = request_data['player']
@@ -200,13 +309,16 @@ def main_loop():
                 if name.endswith('.py'):
                     name = name[:-3]
 
-                success, result = designer.create_new_generator(description, name)
+                try:
+                    success, result = designer.create_new_generator(description, name)
+                except (KeyboardInterrupt, SystemExit):
+                    # 设计期间进程被中断时，已取出的任务写回队首，重启后继续处理
+                    push_front(request_data)
+                    raise
                 if success:
                     print(f"总规划师：新生成器 '{name}.py' 创建成功！将重新处理任务。")
-                    # 将任务重新放回队列进行下一轮处理
-                    current_requests = read_json_file(COMMAND_QUEUE_FILE) or []
-                    current_requests.insert(0, request_data)
-                    write_json_file(COMMAND_QUEUE_FILE, current_requests)
+                    # 将任务写回队首，下一轮优先处理；进程在此之后退出也不会丢失
+                    push_front(request_data)
                 else:
                     print(f"总规划师：创建新生成器失败: {result}")
                 continue # 结束当前循环，下一轮将包含新生成器
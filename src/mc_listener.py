@@ -1,34 +1,64 @@
 # src/mc_listener.py
 import re
 import tailer
-import json
 import os
+import sys
 import time
+import queue
+import threading
+
+# 将根目录添加到 sys.path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.util import read_json_file
+from src.command_queue import QUEUE_PATH, append_request
 
 # 定义文件路径
 # 由于此脚本在 src/ 目录下运行，因此需要使用相对路径返回上一级
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../config/rcon_settings.json')
-QUEUE_PATH = os.path.join(os.path.dirname(__file__), '../command_queue.json')
 
-# 确保 command_queue.json 文件存在
+# 确保 command_queue.jsonl 文件存在
 if not os.path.exists(QUEUE_PATH):
-    with open(QUEUE_PATH, "w") as f:
-        json.dump([], f)
+    open(QUEUE_PATH, 'ab').close()
 
 # 加载配置
-with open(CONFIG_PATH) as f:
-    config = json.load(f)
+config = read_json_file(CONFIG_PATH)
 
 LOG_FILE_PATH = config['log_file_path']
 PLAYER_ID = config['player_id']
 
 print("正在监听服务器日志文件...")
 # 为了效率，在循环外编译正则表达式
-chat_pattern = re.compile(r'\[.+\] \[(?:Server thread/INFO|Async Chat Thread - #\d+/INFO)\]: <(.+?)> ?(.*)')
+# re.ASCII 使 \d 只匹配ASCII数字，不必做Unicode字符类判断
+chat_pattern = re.compile(r'\[.+\] \[(?:Server thread/INFO|Async Chat Thread - #\d+/INFO)\]: <(.+?)> ?(.*)', re.ASCII)
+# 指令都以 '!' 开头，聊天行都含有 ']: <'；缺少其中任一子串的日志行（绝大多数）只做子串查找就跳过，不运行正则
+COMMAND_MARKER = '!'
+CHAT_MARKER = ']: <'
+CHAT_PREFIX = '!build '
+
+# 写队列文件要先取得文件锁再追加一行，放到单独的线程中进行，读取日志不会被慢速的磁盘写入阻塞；
+# 指令仍按检测到的顺序写入
+pending_requests = queue.Queue()
+
+def _queue_writer():
+    while True:
+        request = pending_requests.get()
+        try:
+            # 在文件锁内追加一行，不会与总规划师的取出操作互相覆盖
+            append_request(request)
+            print("请求已添加到队列。")
+        except Exception as e:
+            print(f"写入指令队列时出错: {e}")
+        finally:
+            pending_requests.task_done()
+
+threading.Thread(target=_queue_writer, daemon=True).start()
 
 try:
     # 使用 'gbk' 编码, 这在某些地区的Windows系统上很常见，并且可能适用于此服务器日志。
     for line in tailer.follow(open(LOG_FILE_PATH, encoding='gbk', errors='replace')):
+        if COMMAND_MARKER not in line or CHAT_MARKER not in line:
+            continue
         try:
             match = chat_pattern.search(line)
             
@@ -37,28 +67,17 @@ try:
                 message = match.group(2)
                 
                 # 检查消息是否以特定前缀开头
-                if message.lower().startswith("!build "):
+                if message.lower().startswith(CHAT_PREFIX):
                     # 提取指令内容
-                    prompt = message[len("!build "):].strip()
+                    prompt = message[len(CHAT_PREFIX):].strip()
                     
                     if not prompt:
                         continue
 
                     print(f"检测到玩家 {sender} 的请求: {prompt}")
 
-                    # 将请求添加到队列文件
-                    # Ensure the file exists and is initialized before reading/writing
-                    if not os.path.exists(QUEUE_PATH) or os.path.getsize(QUEUE_PATH) == 0:
-                        with open(QUEUE_PATH, "w") as f:
-                            json.dump([], f)
-
-                    with open(QUEUE_PATH, "r+") as f:
-                        requests = json.load(f)
-                        requests.append({"player": sender, "prompt": prompt})
-                        f.seek(0)
-                        json.dump(requests, f)
-                        f.truncate()
-                    print("请求已添加到队列。")
+                    # 交给写队列线程添加到队列文件
+                    pending_requests.put({"player": sender, "prompt": prompt})
         except Exception as e:
             print(f"处理单行日志时出错: {e} - 日志行: {line.strip()}")
             continue
@@ -67,3 +86,6 @@ except FileNotFoundError:
     print(f"错误: 找不到日志文件，请检查路径配置: {LOG_FILE_PATH}")
 except Exception as e:
     print(f"监听日志文件时发生致命错误: {e}")
+finally:
+    # 退出前写完已检测到的指令
+    pending_requests.join()
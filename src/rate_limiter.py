@@ -0,0 +1,74 @@
+# src/rate_limiter.py
+import time
+import random
+import asyncio
+import threading
+
+# ==============================================================================
+#                             LLM 请求限流
+# ==============================================================================
+
+# 每分钟允许发出的请求数 (RPM) 和 token 数 (TPM)
+DEFAULT_RPM = 60
+DEFAULT_TPM = 300000
+
+# 失败重试的指数退避参数 (秒)
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 30.0
+
+def estimate_tokens(*texts):
+    """粗略估算文本的 token 数：中文约每字一个 token，英文约每 4 个字符一个 token。"""
+    total = 0
+    for text in texts:
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        total += (len(text) - ascii_chars) + ascii_chars // 4
+    return max(total, 1)
+
+def backoff_delay(attempt):
+    """第 attempt 次重试 (从0开始) 前的等待时间：带随机抖动的指数退避，避免并发请求同时重试。"""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+class LeakyBucket:
+    """
+    同时限制 RPM 和 TPM 的漏桶限流器，可在线程和 asyncio 协程中共用。
+    每次请求先预留额度（额度不足时记为欠账），再等待欠账按速率还清后才发出请求。
+    """
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """预留一次请求和 tokens 个 token 的额度，返回需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+            # 单次请求超过整桶容量时按整桶计，否则会永远等待
+            self._requests -= 1
+            self._tokens -= min(tokens, self.tpm)
+            wait_requests = -self._requests * 60.0 / self.rpm if self._requests < 0 else 0.0
+            wait_tokens = -self._tokens * 60.0 / self.tpm if self._tokens < 0 else 0.0
+            return max(wait_requests, wait_tokens)
+
+    def acquire(self, tokens=1):
+        """阻塞直到可以发出请求。"""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens=1):
+        """acquire 的异步版本，等待期间不阻塞事件循环。"""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# 本进程内所有 LLM 请求共用的限流器
+llm_rate_limiter = LeakyBucket()
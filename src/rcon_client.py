@@ -1,64 +1,193 @@
 # src/rcon_client.py
 import json
 import re
-from mcrcon import MCRcon
+import socket
+import struct
+import threading
+import time
+from mcrcon import MCRcon, MCRconException
+from src.util import BlockBuffer, blocks_to_columns, dedupe_columns, merge_columns_into_boxes
+
+# 两次建造进度消息之间至少间隔的秒数；按时间而不是命令数报告，大型 fill 很多时也不会额外增加消息
+PROGRESS_INTERVAL = 1.0
+# 一次连续发出、再统一读取回复的命令数
+RCON_BATCH_SIZE = 32
+# 每批命令末尾附加的哨兵数据包类型；服务器对未知类型回复 "Unknown request"，
+# 按顺序处理请求，收到哨兵的回复即说明这一批命令的回复（包括拆成多个数据包的长回复）都已读完
+SENTINEL_PACKET_TYPE = 0
+
+class PipelinedMCRcon(MCRcon):
+    """
+    可以先连续发出多条命令、再统一读取回复的 MCRcon。每条命令使用不同的请求ID，回复按ID对应回命令；
+    一批命令只需要一次往返，而不是每条命令一次。连接关闭 Nagle 算法，小数据包立即发出。
+    请求ID在整条连接上递增，不会与之前批次的ID重复（MCRcon 自身的命令使用ID 0）。
+    """
+    _last_id = 0
+
+    def _new_id(self):
+        # 保持在 int32 正数范围内
+        self._last_id = self._last_id % 0x7FFFFFFF + 1
+        return self._last_id
+
+    def connect(self):
+        super().connect()
+        raw_socket = self.socket
+        if hasattr(raw_socket, 'setsockopt'):
+            raw_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _read_packet(self):
+        (length,) = struct.unpack("<i", self._read(4))
+        payload = self._read(length)
+        request_id, _ = struct.unpack("<ii", payload[:8])
+        if payload[-2:] != b"\x00\x00":
+            raise MCRconException("Incorrect padding")
+        return request_id, payload[8:-2].decode("utf8")
+
+    def command_batch(self, commands):
+        """一次写出全部命令，按相同顺序返回各自的回复。"""
+        if self.socket is None:
+            raise MCRconException("Must connect before sending data")
+
+        indices = {}
+        packets = bytearray()
+        for index, command in enumerate(commands):
+            request_id = self._new_id()
+            indices[request_id] = index
+            packets += self._packet(request_id, 2, command)
+        sentinel_id = self._new_id()
+        packets += self._packet(sentinel_id, SENTINEL_PACKET_TYPE, "")
+        self.socket.sendall(packets)
+
+        replies = [""] * len(commands)
+        while True:
+            # 较长的回复会拆成多个同ID的数据包，一直读到哨兵的回复为止
+            request_id, data = self._read_packet()
+            if request_id == sentinel_id:
+                return replies
+            index = indices.get(request_id)
+            if index is not None:
+                replies[index] += data
+
+    @staticmethod
+    def _packet(request_id, packet_type, body):
+        payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf8") + b"\x00\x00"
+        return struct.pack("<i", len(payload)) + payload
 
 class RconClient:
     def __init__(self, server_address, rcon_password, player_id):
         self.server_address = server_address
         self.rcon_password = rcon_password
         self.player_id = player_id
+        # 在多次建造之间复用的RCON连接，出错时断开，下次使用时重新连接；
+        # 一条连接同一时间只能有一方收发，查询位置和建造都在锁内进行
+        self._rcon = None
+        self._lock = threading.RLock()
+
+    def _connection(self):
+        if self._rcon is None:
+            rcon = PipelinedMCRcon(self.server_address, self.rcon_password)
+            rcon.connect()
+            self._rcon = rcon
+        return self._rcon
+
+    def _reset_connection(self):
+        if self._rcon is not None:
+            try:
+                self._rcon.disconnect()
+            except OSError:
+                pass
+            self._rcon = None
+
+    def close(self):
+        """断开复用的RCON连接。"""
+        with self._lock:
+            self._reset_connection()
+
+    def _query_position(self, player_name):
+        try:
+            return self._connection().command(f"data get entity {player_name} Pos").strip()
+        except (OSError, MCRconException):
+            # 复用的连接可能已被服务器关闭（例如服务器重启），重新连接后再试一次
+            self._reset_connection()
+            return self._connection().command(f"data get entity {player_name} Pos").strip()
 
     def get_player_position(self, player_name):
         """获取玩家位置，用于确定建筑的起点。"""
         try:
-            with MCRcon(self.server_address, self.rcon_password) as mcr:
-                response = mcr.command(f"data get entity {player_name} Pos").strip()
-                
-                # Find the first '[' and last ']'
-                start_index = response.find('[')
-                end_index = response.rfind(']')
-
-                if start_index != -1 and end_index != -1 and start_index < end_index:
-                    coord_string = response[start_index + 1 : end_index]
-                    parts = coord_string.split(',')
-                    if len(parts) == 3:
-                        x = float(parts[0].strip().rstrip('d'))
-                        y = float(parts[1].strip().rstrip('d'))
-                        z = float(parts[2].strip().rstrip('d'))
-                        return (True, [x, y, z])
-                    else:
-                        return (False, f"坐标格式不正确。捕获的字符串: '{coord_string}'")
+            with self._lock:
+                response = self._query_position(player_name)
+            
+            # Find the first '[' and last ']'
+            start_index = response.find('[')
+            end_index = response.rfind(']')
+
+            if start_index != -1 and end_index != -1 and start_index < end_index:
+                coord_string = response[start_index + 1 : end_index]
+                parts = coord_string.split(',')
+                if len(parts) == 3:
+                    x = float(parts[0].strip().rstrip('d'))
+                    y = float(parts[1].strip().rstrip('d'))
+                    z = float(parts[2].strip().rstrip('d'))
+                    return (True, [x, y, z])
                 else:
-                    return (False, f"无法从RCON响应中找到坐标括号[]。服务器响应: '{response}'")
+                    return (False, f"坐标格式不正确。捕获的字符串: '{coord_string}'")
+            else:
+                return (False, f"无法从RCON响应中找到坐标括号[]。服务器响应: '{response}'")
         except Exception as e:
+            self.close()
             return (False, f"RCON连接或命令执行失败: {e}")
 
     def execute_build(self, block_list):
-        """连接RCON并执行所有setblock命令。"""
-        if not block_list:
+        """
+        通过RCON执行建造。block_list 可以是方块字典列表或 BlockBuffer。
+        同种方块先合并为长方体，每个长方体只发一条 fill 命令，单个方块才用 setblock，
+        RCON往返次数从方块数降到长方体数；命令再按 RCON_BATCH_SIZE 条一批流水线发出，每批只等待一次往返。
+        """
+        if not len(block_list):
             print("建筑清单为空，无需执行。")
             return
-        
-        print(f"准备执行建造... 共计 {len(block_list)} 个方块。")
-        try:
-            with MCRcon(self.server_address, self.rcon_password) as mcr:
-                start_msg_json = f'{{"text":"AI总规划师开始施工... 共 {len(block_list)} 个方块。","color":"gold"}}'
-                mcr.command(f"tellraw @a [{start_msg_json}]")
-
-                for i, block in enumerate(block_list):
-                    cmd = f"setblock {block['x']} {block['y']} {block['z']} {block['block_type']}"
-                    mcr.command(cmd)
-                    if (i + 1) % 100 == 0:
-                        progress_msg_json = f'{{"text":"建造进度: {i+1}/{len(block_list)}...","color":"yellow"}}'
-                        mcr.command(f"tellraw @a [{progress_msg_json}]")
-                
+
+        columns = block_list if isinstance(block_list, BlockBuffer) else blocks_to_columns(block_list)
+        # 重复坐标只会放置最后一个方块，先去重使方块总数与实际放置的一致
+        columns = dedupe_columns(columns)
+        boxes = merge_columns_into_boxes(columns)
+        type_table = columns.type_table
+        total_blocks = len(columns)
+        print(f"准备执行建造... 共计 {total_blocks} 个方块，合并为 {len(boxes)} 条命令。")
+        with self._lock:
+            try:
+                rcon = self._connection()
+                start_msg_json = f'{{"text":"AI总规划师开始施工... 共 {total_blocks} 个方块。","color":"gold"}}'
+                batch = [f"tellraw @a [{start_msg_json}]"]
+
+                placed = 0
+                last_progress = time.monotonic()
+                for x1, y1, z1, x2, y2, z2, type_id in boxes.tolist():
+                    block_type = type_table[type_id]
+                    if (x1, y1, z1) == (x2, y2, z2):
+                        batch.append(f"setblock {x1} {y1} {z1} {block_type}")
+                    else:
+                        batch.append(f"fill {x1} {y1} {z1} {x2} {y2} {z2} {block_type}")
+                    placed += (x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1)
+                    if len(batch) >= RCON_BATCH_SIZE:
+                        rcon.command_batch(batch)
+                        batch = []
+                        # 只在一批命令发完后检查时间，进度消息随下一批一起发出
+                        now = time.monotonic()
+                        if now - last_progress >= PROGRESS_INTERVAL and placed < total_blocks:
+                            progress_msg_json = f'{{"text":"建造进度: {placed}/{total_blocks}...","color":"yellow"}}'
+                            batch.append(f"tellraw @a [{progress_msg_json}]")
+                            last_progress = now
+
+                # 竣工消息与最后一批命令一起发出
                 end_msg_json = f'{{"text":"所有建筑已竣工！","color":"green"}}'
-                mcr.command(f"tellraw @a [{end_msg_json}]")
+                batch.append(f"tellraw @a [{end_msg_json}]")
+                rcon.command_batch(batch)
 
-            print("建造执行完毕。")
-        except Exception as e:
-            print(f"RCON执行期间发生错误: {e}")
+                print("建造执行完毕。")
+            except Exception as e:
+                self._reset_connection()
+                print(f"RCON执行期间发生错误: {e}")
 
 def get_rcon_client():
     """从配置文件加载并返回一个RconClient实例"""
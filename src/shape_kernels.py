@@ -0,0 +1,105 @@
+# src/shape_kernels.py
+# 球体、圆柱、拱门的 Numba 栅格化内核。本模块只在图元的包围网格很大时由 util 按需导入，
+# 避免每个生成器进程都承担导入 numba 的开销。
+# 每个内核都先数出方块数再填充，直接写入恰好大小的 int32 数组，不产生 NumPy 版本中
+# 与整个包围网格同样大小的坐标、距离和掩码临时数组；输出顺序与 NumPy 版本完全一致。
+# 计数和填充都按最外层坐标用 prange 分到多个线程：先求出每一层的方块数，前缀和即为各层在输出中的起点，
+# 各层写入互不重叠的区间，结果与串行循环相同。
+# 并行内核不能被多个线程同时调用（numba 的 workqueue 线程层会终止进程），调用方需持有 util._numba_parallel_lock。
+import numpy as np
+from numba import njit, prange
+
+@njit(cache=True, nogil=True)
+def _in_ring(dist_sq, r_sq, inner_r_sq, hollow):
+    return dist_sq <= r_sq and (not hollow or dist_sq > inner_r_sq)
+
+@njit(cache=True, nogil=True)
+def _offsets(counts):
+    """每一层方块数的前缀和，最后一项为总数。"""
+    starts = np.zeros(len(counts) + 1, dtype=np.int64)
+    for i in range(len(counts)):
+        starts[i + 1] = starts[i] + counts[i]
+    return starts
+
+@njit(cache=True, nogil=True, parallel=True)
+def sphere_kernel(radius, hollow):
+    """返回以原点为中心的球体（或球壳）的局部坐标 (N, 3)。"""
+    r_sq = radius * radius
+    inner_r_sq = (radius - 1) * (radius - 1)
+    size = 2 * radius + 1
+    counts = np.zeros(size, dtype=np.int64)
+    for a in prange(size):
+        i = a - radius
+        count = 0
+        for j in range(-radius, radius + 1):
+            for k in range(-radius, radius + 1):
+                if _in_ring(i * i + j * j + k * k, r_sq, inner_r_sq, hollow):
+                    count += 1
+        counts[a] = count
+    starts = _offsets(counts)
+    out = np.empty((starts[size], 3), dtype=np.int32)
+    for a in prange(size):
+        i = a - radius
+        n = starts[a]
+        for j in range(-radius, radius + 1):
+            for k in range(-radius, radius + 1):
+                if _in_ring(i * i + j * j + k * k, r_sq, inner_r_sq, hollow):
+                    out[n, 0] = i
+                    out[n, 1] = j
+                    out[n, 2] = k
+                    n += 1
+    return out
+
+@njit(cache=True, nogil=True, parallel=True)
+def cylinder_kernel(radius, height, hollow):
+    """返回底面圆心在原点的竖直圆柱（或圆筒）的局部坐标 (N, 3)。"""
+    r_sq = radius * radius
+    inner_r_sq = (radius - 1) * (radius - 1)
+    per_layer = 0
+    for i in range(-radius, radius + 1):
+        for k in range(-radius, radius + 1):
+            if _in_ring(i * i + k * k, r_sq, inner_r_sq, hollow):
+                per_layer += 1
+    layers = max(height, 0)
+    out = np.empty((per_layer * layers, 3), dtype=np.int32)
+    # 每层的方块数相同，第 j 层从 j * per_layer 开始
+    for j in prange(layers):
+        n = j * per_layer
+        for i in range(-radius, radius + 1):
+            for k in range(-radius, radius + 1):
+                if _in_ring(i * i + k * k, r_sq, inner_r_sq, hollow):
+                    out[n, 0] = i
+                    out[n, 1] = j
+                    out[n, 2] = k
+                    n += 1
+    return out
+
+@njit(cache=True, nogil=True, parallel=True)
+def arch_kernel(radius, width):
+    """返回沿 z 方向延伸 width 格的半圆拱的局部坐标 (N, 3)。"""
+    r_sq = radius * radius
+    per_slice = 0
+    for i in range(-radius, radius + 1):
+        for j in range(radius + 1):
+            if abs(i * i + j * j - r_sq) < radius:
+                per_slice += 1
+    slices = max(width, 0)
+    out = np.empty((per_slice * slices, 3), dtype=np.int32)
+    for k in prange(slices):
+        n = k * per_slice
+        for i in range(-radius, radius + 1):
+            for j in range(radius + 1):
+                if abs(i * i + j * j - r_sq) < radius:
+                    out[n, 0] = i
+                    out[n, 1] = j
+                    out[n, 2] = k
+                    n += 1
+    return out
+
+def warm_up():
+    """用很小的参数调用一次各内核，提前完成编译（或从磁盘缓存载入），第一个大型建筑不必等待。"""
+    sphere_kernel(1, False)
+    sphere_kernel(1, True)
+    cylinder_kernel(1, 1, False)
+    cylinder_kernel(1, 1, True)
+    arch_kernel(1, 1)
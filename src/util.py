@@ -1,31 +1,151 @@
 # src/util.py
+import ast
 import json
+import collections
 import os
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import openai
 import traceback
 import time
+import numpy as np
+from dataclasses import dataclass
 from openai import APIConnectionError, RateLimitError, APIError
+from src.rate_limiter import llm_rate_limiter, estimate_tokens, backoff_delay
+from src.llm_cache import GenerativeCache
+
+try:
+    import orjson
+except ImportError:
+    # 未安装 orjson 时退回标准库 json
+    orjson = None
 
 # ==============================================================================
 #                             文件读写工具
 # ==============================================================================
 
+def json_loads(text):
+    """解析JSON文本或UTF-8字节，有 orjson 时使用 orjson；解析失败统一抛出 json.JSONDecodeError。"""
+    if orjson is not None:
+        return orjson.loads(text)  # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类
+    return json.loads(text)
+
+# 进程内缓存的已解析JSON文件数；绝对路径 -> (st_mtime_ns, st_size, 解析结果)，按最近使用顺序淘汰
+JSON_CACHE_SIZE = 64
+_json_cache = collections.OrderedDict()
+_json_cache_lock = threading.Lock()
+
 def read_json_file(file_path):
-    """读取并解析JSON文件。"""
+    """
+    读取并解析JSON文件。文件的修改时间和大小都没有变化时直接返回上次的解析结果，只做一次 stat；
+    返回的对象会被后续调用共享，调用方不要原地修改。
+    """
+    key = os.path.abspath(file_path)
     try:
-        if not os.path.exists(file_path):
-            return None
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        st = os.stat(key)
+    except FileNotFoundError:
+        return None
+    with _json_cache_lock:
+        cached = _json_cache.get(key)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            _json_cache.move_to_end(key)
+            return cached[2]
+    try:
+        with open(key, 'rb') as f:
+            data = json_loads(f.read())
     except (json.JSONDecodeError, FileNotFoundError) as e:
         print(f"读取或解析JSON文件时出错 {file_path}: {e}")
         return None
+    with _json_cache_lock:
+        _json_cache[key] = (st.st_mtime_ns, st.st_size, data)
+        _json_cache.move_to_end(key)
+        if len(_json_cache) > JSON_CACHE_SIZE:
+            _json_cache.popitem(last=False)
+    return data
+
+# 标准库 json 回退路径使用的写缓冲区大小
+JSON_WRITE_BUFFER_SIZE = 1 << 20
+
+# 超过该大小的文件在 Linux 上先预分配磁盘空间再写入
+LARGE_WRITE_THRESHOLD = 2 * 1024 * 1024
+
+def _write_bytes(file_path, payload):
+    """
+    把字节一次性写入文件。大文件在支持 posix_fallocate 的系统上先预分配空间，
+    避免写入过程中文件系统反复扩展文件；不支持时直接写入。
+    """
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if len(payload) >= LARGE_WRITE_THRESHOLD and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, len(payload))
+            except OSError:
+                pass  # 某些文件系统不支持预分配，直接写入即可
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def _json_default(obj):
+    """标准库 json 回退路径的序列化钩子：与 orjson 的 OPT_SERIALIZE_NUMPY 一样接受 NumPy 数组和标量。"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# 流式写出 BlockBuffer 时每次转换并编码的方块数
+BLOCK_WRITE_CHUNK = 65536
+
+def json_dumps(data):
+    """把数据编码为紧凑的UTF-8 JSON字节。"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+def _write_plan_streaming(file_path, data):
+    """
+    写出 "blocks" 为 BlockBuffer 的建造蓝图：先写其余字段，再按 BLOCK_WRITE_CHUNK 分块把方块转换为字典并编码写出，
+    内存中同时只存在一块方块字典和它的编码结果，不会出现完整的方块字典列表和完整的JSON文本。
+    写出的内容与先调用 columns_to_blocks 再整体编码完全相同（blocks 放在最后）。
+    """
+    columns = data['blocks']
+    rest = {key: value for key, value in data.items() if key != 'blocks'}
+    head = json_dumps(rest)[:-1]
+    with open(file_path, 'wb', buffering=JSON_WRITE_BUFFER_SIZE) as f:
+        f.write(head + (b',"blocks":[' if rest else b'"blocks":['))
+        for start in range(0, len(columns), BLOCK_WRITE_CHUNK):
+            chunk = columns.take(slice(start, start + BLOCK_WRITE_CHUNK))
+            if start:
+                f.write(b',')
+            f.write(json_dumps(columns_to_blocks(chunk))[1:-1])
+        f.write(b']}\n')
 
 def write_json_file(file_path, data):
-    """将数据写入JSON文件。"""
+    """
+    将数据以紧凑格式写入JSON文件。
+    有 orjson 时整体编码为UTF-8字节后一次写入；否则用 json.dump 经 1MB 缓冲区流式写出，
+    不在内存中拼出完整的字符串，写入的系统调用次数也只与文件大小/1MB 相当。
+    "blocks" 为 BlockBuffer 的建造蓝图按块流式写出，方块字典只在写入时分批生成。
+    """
+    # 文件系统的修改时间精度有限，同一时刻内写入的同样大小的内容可能与缓存的条目无法区分，写入时直接使其失效
+    with _json_cache_lock:
+        _json_cache.pop(os.path.abspath(file_path), None)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        if isinstance(data, dict) and isinstance(data.get('blocks'), BlockBuffer):
+            _write_plan_streaming(file_path, data)
+        elif orjson is not None:
+            payload = orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY)
+            _write_bytes(file_path, payload)
+        else:
+            with open(file_path, 'w', encoding='utf-8', buffering=JSON_WRITE_BUFFER_SIZE) as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+                f.write('\n')
     except Exception as e:
         print(f"写入JSON文件时出错 {file_path}: {e}")
 
@@ -44,27 +164,165 @@ def read_file_content(file_path):
 #                             API 相关工具 (DeepSeek)
 # ==============================================================================
 
+# LLM 客户端的连接池：空闲连接保留 5 分钟，同一进程内的后续请求（包括并发请求）不必重新进行 DNS 和 TLS 握手
+LLM_HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32, keepalive_expiry=300)
+
+@functools.lru_cache(maxsize=8)
 def get_llm_client(api_key):
-    """根据提供的API Key获取DeepSeek LLM API客户端。"""
+    """
+    根据提供的API Key获取DeepSeek LLM API客户端。
+    同一进程内相同的 Key 复用同一个客户端及其连接池，省去重复的 DNS 和 TLS 握手。
+    """
     if not api_key:
         raise ValueError("API Key不能为空。")
     
     return openai.OpenAI(
         api_key=api_key,
         base_url="https://api.deepseek.com/v1",
-        timeout=300.0 # 设置300秒超时
+        timeout=300.0, # 设置300秒超时
+        http_client=openai.DefaultHttpxClient(limits=LLM_HTTP_LIMITS)
     )
 
-def get_llm_response(client, system_prompt, user_prompt, expect_json=True):
+def get_async_llm_client(api_key):
+    """根据提供的API Key获取异步的DeepSeek LLM API客户端，用于并发请求。"""
+    if not api_key:
+        raise ValueError("API Key不能为空。")
+
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url="https://api.deepseek.com/v1",
+        timeout=300.0, # 设置300秒超时
+        http_client=openai.DefaultAsyncHttpxClient(limits=LLM_HTTP_LIMITS)
+    )
+
+def _strip_json_fence(text_response):
+    """去掉LLM响应外层的 ```json ... ``` 代码块标记。"""
+    if text_response.startswith('```json'):
+        text_response = text_response[len('```json'):].strip()
+    if text_response.endswith('```'):
+        text_response = text_response[:-len('```')].strip()
+    return text_response
+
+def _repair_json_text(text):
+    """
+    修复LLM常见的JSON格式问题：截取最外层的 {...} 或 [...]（去掉前后的说明文字），
+    删除字符串之外的 // 与 /* */ 注释，以及对象和数组结尾多余的逗号。
+    """
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if starts:
+        start = min(starts)
+        end = text.rfind('}' if text[start] == '{' else ']')
+        if end > start:
+            text = text[start:end + 1]
+
+    out = []
+    i, n = 0, len(text)
+    in_string = False
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if ch == '\\' and i + 1 < n:
+                out.append(text[i + 1])
+                i += 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif text.startswith('//', i):
+            newline = text.find('\n', i)
+            i = n if newline == -1 else newline
+            continue
+        elif text.startswith('/*', i):
+            close = text.find('*/', i + 2)
+            i = n if close == -1 else close + 2
+            continue
+        elif ch in '}]':
+            # 去掉紧挨着右括号的逗号（中间可能隔着空白）
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ',':
+                del out[j]
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return ''.join(out)
+
+def parse_llm_json(text_response):
+    """
+    解析LLM返回的JSON。严格解析失败时先在本地修复常见格式问题，
+    再尝试按 Python 字面量解析（单引号、True/None），都失败才抛出最初的 JSONDecodeError，
+    这样格式小问题不必再花一次网络请求重试。
+    """
+    text_response = _strip_json_fence(text_response)
+    try:
+        return json_loads(text_response)
+    except json.JSONDecodeError as original_error:
+        repaired = _repair_json_text(text_response)
+        try:
+            return json_loads(repaired)
+        except json.JSONDecodeError:
+            pass
+        try:
+            value = ast.literal_eval(repaired)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            raise original_error
+        if isinstance(value, (dict, list)):
+            return value
+        raise original_error
+
+def _iter_stream_deltas(response, progress_callback=None):
+    """逐个产出流式响应中的文本片段，每收到一个片段就通过回调报告已接收的字符数。"""
+    received = 0
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        received += len(delta)
+        if progress_callback:
+            progress_callback(received)
+        yield delta
+
+def _read_stream(response, progress_callback=None):
+    """拼接流式响应中的文本片段，每收到一个片段就通过回调报告已接收的字符数。"""
+    return "".join(_iter_stream_deltas(response, progress_callback))
+
+def _response_format(expect_json, response_schema):
+    """
+    给定 response_schema 时开启服务端的 JSON 模式，保证返回的是合法的 JSON 对象。
+    deepseek-chat 只支持 {"type": "json_object"}，不接受 json_schema，因此 schema 中的必填字段在本地校验。
+    """
+    if expect_json and response_schema is not None:
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+def _missing_required_keys(value, response_schema):
+    """返回响应中缺少的 schema 必填字段列表。"""
+    if response_schema is None:
+        return []
+    if not isinstance(value, dict):
+        return list(response_schema.get("required", []))
+    return [key for key in response_schema.get("required", []) if key not in value]
+
+def get_llm_response(client, system_prompt, user_prompt, expect_json=True, stream=False, progress_callback=None,
+                     response_schema=None):
     """
     请求LLM获取响应，并带有自动重试机制。
+    stream=True 时以流式方式接收响应，progress_callback(已接收字符数) 会在每个片段到达时被调用。
+    response_schema 为顶层是对象的 JSON Schema 时以 JSON 模式请求，并检查其中的必填字段。
     """
     max_retries = 3
-    retry_delay = 5  # seconds
     text_response = ""
+    prompt_tokens = estimate_tokens(system_prompt, user_prompt)
 
     for attempt in range(max_retries):
         try:
+            llm_rate_limiter.acquire(prompt_tokens)
             response = client.chat.completions.create(
                 model="deepseek-chat",
                 messages=[
@@ -73,45 +331,630 @@ def get_llm_response(client, system_prompt, user_prompt, expect_json=True):
                 ],
                 max_tokens=4096,
                 temperature=0.7,
+                stream=stream,
+                **_response_format(expect_json, response_schema),
             )
             
-            text_response = response.choices[0].message.content.strip()
+            if stream:
+                text_response = _read_stream(response, progress_callback).strip()
+            else:
+                text_response = response.choices[0].message.content.strip()
             
             if not text_response:
                 raise ValueError("LLM returned an empty response.")
             
             if expect_json:
-                if text_response.startswith('```json'):
-                    text_response = text_response[len('```json'):].strip()
-                if text_response.endswith('```'):
-                    text_response = text_response[:-len('```')].strip()
-                
-                return (True, json.loads(text_response))
+                value = parse_llm_json(text_response)
+                missing = _missing_required_keys(value, response_schema)
+                if missing:
+                    return (False, f"LLM响应缺少必填字段 {missing}\n原始响应: {text_response}")
+                return (True, value)
             else:
                 return (True, text_response)
 
         except (APIConnectionError, RateLimitError, APIError) as e:
-            print(f"LLM API error: {e}. Retrying in {retry_delay}s... (Attempt {attempt + 1}/{max_retries})")
+            retry_delay = backoff_delay(attempt)
+            print(f"LLM API error: {e}. Retrying in {retry_delay:.1f}s... (Attempt {attempt + 1}/{max_retries})")
             time.sleep(retry_delay)
         except json.JSONDecodeError as e:
             return (False, f"解析LLM响应的JSON时发生错误: {e}\n原始响应: {text_response}")
         except Exception as e:
-            print(f"An unexpected error occurred: {e}. Retrying in {retry_delay}s... (Attempt {attempt + 1}/{max_retries})")
+            retry_delay = backoff_delay(attempt)
+            print(f"An unexpected error occurred: {e}. Retrying in {retry_delay:.1f}s... (Attempt {attempt + 1}/{max_retries})")
             time.sleep(retry_delay)
 
     return (False, f"调用LLM失败，已达到最大重试次数 ({max_retries} 次)。")
 
+def iter_json_array_items(chunks):
+    """
+    从文本片段流中增量扫描顶层 JSON 数组，每当一个元素完整到达就产出它的原始文本。
+    数组之前的代码块标记或说明文字会被跳过（在 '[' 之前先遇到 '{' 则视为顶层不是数组）；
+    扫描只跟踪括号深度和字符串，不做完整解析。
+    每个完整元素产出 (True, 元素文本)；数组没有出现或没有闭合时，最后再产出 (False, 全部文本)，
+    由调用方决定如何处理。
+    """
+    seen = []
+    element = []
+    depth = 0          # 0: 尚未进入数组; 1: 位于数组元素之间或标量元素内
+    in_string = False
+    escaped = False
+    finished = False
+    scanning = True    # 顶层是对象时不再扫描，整段交给调用方
+    for chunk in chunks:
+        seen.append(chunk)
+        if not scanning:
+            continue
+        for ch in chunk:
+            if depth == 0:
+                if ch == '[':
+                    depth = 1
+                elif ch == '{':
+                    scanning = False
+                    break
+                continue
+            if in_string:
+                element.append(ch)
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if depth == 1 and ch in ',]':
+                text = ''.join(element).strip()
+                element = []
+                if text:
+                    yield True, text
+                if ch == ']':
+                    finished = True
+                    scanning = False
+                    break
+                continue
+            element.append(ch)
+            if ch == '"':
+                in_string = True
+            elif ch in '{[':
+                depth += 1
+            elif ch in '}]':
+                depth -= 1
+    if not finished:
+        yield False, ''.join(seen)
+
+def stream_llm_components(client, system_prompt, user_prompt, progress_callback=None):
+    """
+    以流式方式请求LLM，响应是JSON数组时每收到一个完整元素就立即解析并产出，
+    调用方可以一边接收后续 token 一边展开已经到达的图元。
+    没有产出任何元素之前的失败会像 get_llm_response 一样退避重试；之后的失败直接抛出，
+    因为调用方已经消费了部分结果。响应不是数组时抛出 ValueError。
+    """
+    max_retries = 3
+    prompt_tokens = estimate_tokens(system_prompt, user_prompt)
+
+    for attempt in range(max_retries):
+        yielded = False
+        try:
+            llm_rate_limiter.acquire(prompt_tokens)
+            response = client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=4096,
+                temperature=0.7,
+                stream=True,
+            )
+            for complete, text in iter_json_array_items(_iter_stream_deltas(response, progress_callback)):
+                if complete:
+                    try:
+                        item = parse_llm_json(text)
+                    except json.JSONDecodeError as e:
+                        print(f"跳过无法解析的数组元素: {e}\n原始内容: {text}")
+                        continue
+                    yielded = True
+                    yield item
+                    continue
+
+                if yielded:
+                    # 数组没有闭合，通常是输出达到 max_tokens 被截断；保留已经完整到达的元素
+                    print("警告：LLM响应中的JSON数组没有闭合，可能被截断，已保留完整到达的元素。")
+                    break
+                # 响应里没有数组：按整段响应解析一次
+                if not text.strip():
+                    raise ValueError("LLM returned an empty response.")
+                try:
+                    value = parse_llm_json(text)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"解析LLM响应的JSON时发生错误: {e}\n原始响应: {text}") from e
+                if not isinstance(value, list):
+                    raise ValueError(f"LLM响应不是JSON数组: {text}")
+                yield from value
+            return
+
+        except ValueError:
+            raise
+        except Exception as e:
+            if yielded or attempt == max_retries - 1:
+                raise
+            retry_delay = backoff_delay(attempt)
+            print(f"LLM API error: {e}. Retrying in {retry_delay:.1f}s... (Attempt {attempt + 1}/{max_retries})")
+            time.sleep(retry_delay)
+
+_llm_cache = None
+
+def _get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = GenerativeCache()
+    return _llm_cache
+
+def semantic_cache_available():
+    """LLM缓存是否能做语义匹配（句向量模型已载入）；否则只能精确匹配。"""
+    try:
+        return _get_llm_cache().semantic_available
+    except Exception:
+        return False
+
+def _cache_lookup(partition, user_prompt, semantic, max_age=None):
+    """查询响应缓存，返回 (是否命中, 缓存的响应)；缓存出错时视为未命中。"""
+    try:
+        hit, cached = _get_llm_cache().lookup(partition, user_prompt, semantic=semantic, max_age=max_age)
+        if hit:
+            print("LLM缓存命中，跳过本次请求。")
+        return hit, cached
+    except Exception as e:
+        print(f"读取LLM缓存时出错: {e}")
+        return False, None
+
+def _cache_store(partition, user_prompt, response, semantic):
+    try:
+        _get_llm_cache().store(partition, user_prompt, response, semantic=semantic)
+    except Exception as e:
+        print(f"写入LLM缓存时出错: {e}")
+
+def _cache_keys(expect_json, system_prompt, user_prompt, cache_context, cache_prompt):
+    """返回 (缓存分区, 用于匹配的 prompt)。"""
+    partition = f"json={expect_json}\n{system_prompt}"
+    if cache_context is not None:
+        partition = f"{partition}\n{cache_context}"
+    return partition, user_prompt if cache_prompt is None else cache_prompt
+
+def get_cached_llm_response(client, system_prompt, user_prompt, expect_json=True, semantic=True, max_age=None,
+                            cache_context=None, cache_prompt=None, cache_if=None, **kwargs):
+    """
+    带语义缓存的 get_llm_response：system prompt 相同且 user prompt 相同或语义相近时直接返回缓存的响应。
+    semantic=False 或没有句向量模型时只有 user prompt 完全相同才命中；max_age (秒) 不为空时不使用更早缓存的响应。
+    user prompt 中带有大段共用的上下文（如可用工具列表）时，把上下文传给 cache_context 并入分区，
+    把真正需要比较的部分传给 cache_prompt，否则共用的上下文会让不同的请求在语义上也显得相近。
+    只缓存成功的响应；cache_if 不为空时只缓存、只复用 cache_if(响应) 为真的响应。缓存读写出错时退化为直接请求LLM。
+    """
+    partition, key_prompt = _cache_keys(expect_json, system_prompt, user_prompt, cache_context, cache_prompt)
+    hit, cached = _cache_lookup(partition, key_prompt, semantic, max_age)
+    if hit and (cache_if is None or cache_if(cached)):
+        return (True, cached)
+
+    success, response = get_llm_response(client, system_prompt, user_prompt, expect_json=expect_json, **kwargs)
+    if success and (cache_if is None or cache_if(response)):
+        _cache_store(partition, key_prompt, response, semantic)
+    return (success, response)
+
+def lookup_cached_llm_response(system_prompt, user_prompt, expect_json=True, semantic=False, max_age=None):
+    """
+    只查询响应缓存，返回 (是否命中, 缓存的响应)，与 get_cached_llm_response 使用同一套缓存键。
+    用于自行发出请求（如批量、异步请求）的调用方，配合 store_cached_llm_response 写入。
+    """
+    partition, key_prompt = _cache_keys(expect_json, system_prompt, user_prompt, None, None)
+    return _cache_lookup(partition, key_prompt, semantic, max_age)
+
+def store_cached_llm_response(system_prompt, user_prompt, response, expect_json=True, semantic=False):
+    """把一条成功的响应写入缓存，之后以相同 prompt 调用 get_cached_llm_response 或 lookup_cached_llm_response 即可命中。"""
+    partition, key_prompt = _cache_keys(expect_json, system_prompt, user_prompt, None, None)
+    _cache_store(partition, key_prompt, response, semantic)
+
+# 同时进行中的预取请求数上限；名额用完时新的预取直接放弃，不与正式请求争抢限流额度
+MAX_PREFETCH_REQUESTS = 2
+_prefetch_slots = threading.BoundedSemaphore(MAX_PREFETCH_REQUESTS)
+# 只有常驻进程（总规划师、生成器服务）才预取：以子进程运行的生成器写完蓝图就退出，
+# 守护线程中的请求会被中途打断，既花了 token 又没有写入缓存
+_prefetch_enabled = False
+
+def enable_prefetch():
+    """在常驻进程启动时调用，允许 prefetch_llm_responses 真正发出预取请求。"""
+    global _prefetch_enabled
+    _prefetch_enabled = True
+
+def _prefetch_worker(client, system_prompt, user_prompt):
+    try:
+        # 预取的是之后原样发出的请求，只按精确匹配查询和写入
+        get_cached_llm_response(client, system_prompt, user_prompt, semantic=False)
+    except Exception as e:
+        print(f"预取LLM响应时出错: {e}")
+    finally:
+        _prefetch_slots.release()
+
+def prefetch_llm_responses(client, requests):
+    """
+    在后台线程中为接下来很可能用到的 (system_prompt, user_prompt) 请求LLM并写入响应缓存，立即返回已启动的线程。
+    调用方在处理当前响应的同时，后续请求的LLM延迟已经在后台开始消化；已缓存的请求不会重复发出。
+    没有调用过 enable_prefetch 的进程（以子进程运行的生成器）中什么也不做。
+    """
+    threads = []
+    if not _prefetch_enabled:
+        return threads
+    for system_prompt, user_prompt in requests:
+        if not _prefetch_slots.acquire(blocking=False):
+            break
+        thread = threading.Thread(target=_prefetch_worker, args=(client, system_prompt, user_prompt), daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+async def _read_stream_async(response, progress_callback=None):
+    """_read_stream 的异步版本。"""
+    parts = []
+    received = 0
+    async for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+        received += len(delta)
+        if progress_callback:
+            progress_callback(received)
+    return "".join(parts)
+
+async def get_llm_response_async(client, system_prompt, user_prompt, expect_json=True, stream=False,
+                                 progress_callback=None, semaphore=None, response_schema=None):
+    """
+    get_llm_response 的异步版本，client 需为 get_async_llm_client 返回的客户端，参数和返回值与同步版本一致。
+    semaphore (asyncio.Semaphore) 用于限制同时进行中的请求数，重试等待期间不占用名额。
+    """
+    max_retries = 3
+    text_response = ""
+    prompt_tokens = estimate_tokens(system_prompt, user_prompt)
+    semaphore = semaphore or contextlib.nullcontext()
+
+    for attempt in range(max_retries):
+        try:
+            async with semaphore:
+                await llm_rate_limiter.acquire_async(prompt_tokens)
+                response = await client.chat.completions.create(
+                    model="deepseek-chat",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=4096,
+                    temperature=0.7,
+                    stream=stream,
+                    **_response_format(expect_json, response_schema),
+                )
+
+                if stream:
+                    text_response = (await _read_stream_async(response, progress_callback)).strip()
+                else:
+                    text_response = response.choices[0].message.content.strip()
+
+            if not text_response:
+                raise ValueError("LLM returned an empty response.")
+
+            if expect_json:
+                value = parse_llm_json(text_response)
+                missing = _missing_required_keys(value, response_schema)
+                if missing:
+                    return (False, f"LLM响应缺少必填字段 {missing}\n原始响应: {text_response}")
+                return (True, value)
+            else:
+                return (True, text_response)
+
+        except (APIConnectionError, RateLimitError, APIError) as e:
+            retry_delay = backoff_delay(attempt)
+            print(f"LLM API error: {e}. Retrying in {retry_delay:.1f}s... (Attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(retry_delay)
+        except json.JSONDecodeError as e:
+            return (False, f"解析LLM响应的JSON时发生错误: {e}\n原始响应: {text_response}")
+        except Exception as e:
+            retry_delay = backoff_delay(attempt)
+            print(f"An unexpected error occurred: {e}. Retrying in {retry_delay:.1f}s... (Attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(retry_delay)
+
+    return (False, f"调用LLM失败，已达到最大重试次数 ({max_retries} 次)。")
+
+# ==============================================================================
+#                             方块列式存储与空间元数据
+# ==============================================================================
+# 生成器内部使用列式结构 (SoA) BlockBuffer 存放方块，
+# 只有在写入蓝图JSON时才转换回 [{'x':..,'y':..,'z':..,'block_type':..}, ...] 的格式。
+
+@dataclass
+class BlockBuffer:
+    """
+    方块的列式存储：coords 为 (N, 3) 的 int32 坐标数组，
+    type_ids 为 (N,) 的 uint16 数组，存放方块类型在 type_table 中的下标。
+    """
+    coords: np.ndarray
+    type_ids: np.ndarray
+    type_table: list
+
+    def __len__(self):
+        return len(self.coords)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 3), dtype=np.int32), np.empty(0, dtype=np.uint16), [])
+
+    @classmethod
+    def from_coords(cls, coords, block_type):
+        """由 (N, 3) 坐标数组构造单一方块类型的 BlockBuffer。"""
+        coords = np.ascontiguousarray(coords, dtype=np.int32).reshape(-1, 3)
+        return cls(coords, np.zeros(len(coords), dtype=np.uint16), [block_type])
+
+    def take(self, indices):
+        """按下标选取方块，返回共享同一张类型表的新 BlockBuffer。"""
+        return BlockBuffer(self.coords[indices], self.type_ids[indices], self.type_table)
+
+def blocks_to_columns(blocks):
+    """将方块字典列表转换为 BlockBuffer。"""
+    count = len(blocks)
+    coords = np.fromiter((v for block in blocks for v in (block['x'], block['y'], block['z'])),
+                         dtype=np.int32, count=3 * count).reshape(-1, 3)
+    type_index = {}
+    type_ids = np.fromiter((type_index.setdefault(block['block_type'], len(type_index)) for block in blocks),
+                           dtype=np.uint16, count=count)
+    return BlockBuffer(coords, type_ids, list(type_index))
+
+def columns_to_blocks(columns):
+    """将 BlockBuffer 转换回写入JSON所用的方块字典列表。"""
+    type_table = columns.type_table
+    return [
+        {'x': x, 'y': y, 'z': z, 'block_type': type_table[type_id]}
+        for (x, y, z), type_id in zip(columns.coords.tolist(), columns.type_ids.tolist())
+    ]
+
+def concat_columns(parts):
+    """合并多个 BlockBuffer，各自的类型表合并为一张，方块顺序与 parts 的顺序一致。"""
+    type_index = {}
+    remaps = []
+    for part in parts:
+        remaps.append(np.array([type_index.setdefault(name, len(type_index)) for name in part.type_table],
+                               dtype=np.uint16))
+    if not parts:
+        return BlockBuffer.empty()
+    coords = np.concatenate([part.coords for part in parts])
+    # 空的类型表对应的部分没有方块，用一个占位元素保证能够索引
+    type_ids = np.concatenate([(remap if len(remap) else np.zeros(1, dtype=np.uint16))[part.type_ids]
+                               for part, remap in zip(parts, remaps)])
+    return BlockBuffer(coords, type_ids, list(type_index))
+
+def _pack_coords(coords):
+    """
+    把 (N, 3) 坐标相对最小值平移后按每轴 21 位打包成 int64 键，使按行去重变成一维 np.unique；
+    任一轴的跨度超过 21 位时返回 None。方块数量很大时改用 Numba 内核，一次遍历完成平移和打包。
+    """
+    if len(coords) >= NUMBA_BBOX_THRESHOLD:
+        kernels = _get_bbox_kernels()
+        if kernels:
+            mins, maxs = kernels.bbox_kernel(coords)
+            if (maxs - mins).max() >= (1 << 21):
+                return None
+            with _numba_parallel_lock:
+                return kernels.pack_coords_kernel(coords, mins)
+    shifted = coords.astype(np.int64) - coords.min(axis=0)
+    if shifted.max(initial=0) >= (1 << 21):
+        return None
+    return (shifted[:, 0] << 42) | (shifted[:, 1] << 21) | shifted[:, 2]
+
+def dedupe_columns(columns):
+    """
+    去除重复坐标，同一坐标只保留最后写入的方块（与逐个放置的结果一致），其余方块保持原有顺序。
+    """
+    if not len(columns):
+        return columns
+    keys = _pack_coords(columns.coords)
+    if keys is not None:
+        _, last_reversed = np.unique(keys[::-1], return_index=True)
+    else:
+        _, last_reversed = np.unique(columns.coords[::-1], axis=0, return_index=True)
+    if len(last_reversed) == len(columns):
+        return columns
+    return columns.take(np.sort(len(columns) - 1 - last_reversed))
+
+def sort_columns(columns):
+    """
+    按 (block_type, y, z, x) 对方块排序，返回新的 BlockBuffer。
+    同种方块的同一行在结果中是连续的，便于放置端合并为 /fill 命令。
+    排序会打乱放置顺序，因此会先调用 dedupe_columns 去除重复坐标。
+    """
+    columns = dedupe_columns(columns)
+    if not len(columns):
+        return columns
+    # 类型下标按名称的字典序重新编号，使排序结果与按名称排序一致
+    name_rank = np.empty(len(columns.type_table), dtype=np.int64)
+    name_rank[np.argsort(np.asarray(columns.type_table))] = np.arange(len(columns.type_table))
+    coords = columns.coords
+    order = np.lexsort((coords[:, 0], coords[:, 2], coords[:, 1], name_rank[columns.type_ids]))
+    return columns.take(order)
+
+# 原版 /fill 一次最多填充的方块数
+MAX_FILL_VOLUME = 32768
+
+def _split_runs(group_keys, step, area):
+    """
+    在已排序的行中找出连续段：group_keys 各列都相同、step 逐行加一的行属于同一段，
+    每段的行数不超过 MAX_FILL_VOLUME // area。返回各段首行和末行的下标。
+    """
+    n = len(step)
+    breaks = np.ones(n, dtype=bool)
+    breaks[1:] = (group_keys[1:] != group_keys[:-1]).any(axis=1) | (step[1:] != step[:-1] + 1)
+    run_start = np.flatnonzero(breaks)
+    position = np.arange(n) - run_start[np.cumsum(breaks) - 1]
+    breaks |= position % np.maximum(MAX_FILL_VOLUME // area, 1) == 0
+    starts = np.flatnonzero(breaks)
+    return starts, np.append(starts[1:], n) - 1
+
+def merge_columns_into_boxes(columns):
+    """
+    把方块合并为同种方块的长方体，用于生成 /fill 命令。同一坐标只保留最后写入的方块。
+    先沿 x 合并连续的方块为行，再把 x 范围相同、z 相邻的行合并为矩形，最后把相同矩形沿 y 合并为长方体；
+    全程只对坐标数组排序，不需要按包围盒分配稠密网格，稀疏的大型建筑也不会占用大量内存。
+    返回 (x1, y1, z1, x2, y2, z2, 类型下标) 的 (M, 7) int64 数组，按 (y1, z1, x1) 自下而上排列。
+    """
+    columns = dedupe_columns(columns)
+    if not len(columns):
+        return np.empty((0, 7), dtype=np.int64)
+    coords = columns.coords.astype(np.int64)
+    type_ids = columns.type_ids.astype(np.int64)
+    x, y, z = coords[:, 0], coords[:, 1], coords[:, 2]
+
+    # 1. 沿 x 合并为行
+    order = np.lexsort((x, z, y, type_ids))
+    t, x, y, z = type_ids[order], x[order], y[order], z[order]
+    starts, ends = _split_runs(np.stack((t, y, z), axis=1), x, 1)
+    t, y, z, x1, x2 = t[starts], y[starts], z[starts], x[starts], x[ends]
+
+    # 2. x 范围相同的行沿 z 合并为矩形
+    order = np.lexsort((z, x2, x1, y, t))
+    t, y, z, x1, x2 = t[order], y[order], z[order], x1[order], x2[order]
+    starts, ends = _split_runs(np.stack((t, y, x1, x2), axis=1), z, x2 - x1 + 1)
+    t, y, x1, x2, z1, z2 = t[starts], y[starts], x1[starts], x2[starts], z[starts], z[ends]
+
+    # 3. 相同的矩形沿 y 合并为长方体
+    order = np.lexsort((y, z2, z1, x2, x1, t))
+    t, y, x1, x2, z1, z2 = t[order], y[order], x1[order], x2[order], z1[order], z2[order]
+    starts, ends = _split_runs(np.stack((t, x1, x2, z1, z2), axis=1), y, (x2 - x1 + 1) * (z2 - z1 + 1))
+    boxes = np.stack((x1[starts], y[starts], z1[starts], x2[starts], y[ends], z2[starts], t[starts]), axis=1)
+
+    # 自下而上放置，先放好起支撑作用的方块
+    return boxes[np.lexsort((boxes[:, 0], boxes[:, 2], boxes[:, 1]))]
+
+# 任务列表至少有这么多个图元时用线程池并行展开。NumPy 的大数组运算和 Numba 内核 (nogil) 都会释放 GIL，
+# 大型图元可以真正并行；图元太少时线程调度的开销得不偿失
+PARALLEL_EXPANSION_MIN_TASKS = 16
+_expansion_pool = None
+
+def _get_expansion_pool():
+    global _expansion_pool
+    if _expansion_pool is None:
+        _expansion_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="expand")
+    return _expansion_pool
+
+def _expand_task(task):
+    """展开单个图元，同时求出它的边界框；没有方块时返回 None。"""
+    shape = generate_columns_from_task(task)
+    if not len(shape):
+        return None
+    return shape, shape.coords.min(axis=0), shape.coords.max(axis=0)
+
+def generate_columns_with_bbox(tasks):
+    """
+    先展开所有几何图元任务，并在每个图元刚生成、数据仍在缓存中时求出它的边界框，
+    省去之后对全部方块的第二遍扫描；再按总数一次分配 int32 缓冲区并逐段复制，不做任何扩容。
+    tasks 是足够长的列表时在线程池中并行展开；是迭代器（例如流式到达的LLM输出）时逐个展开，
+    不会提前把它读完。两种方式的结果完全相同。
+    返回 (BlockBuffer, (mins, maxs))，没有方块时边界框为 (None, None)。
+    """
+    if isinstance(tasks, list) and len(tasks) >= PARALLEL_EXPANSION_MIN_TASKS:
+        expanded = _get_expansion_pool().map(_expand_task, tasks)
+    else:
+        expanded = map(_expand_task, tasks)
+
+    shapes = []
+    type_index = {}
+    mins = maxs = None
+    for result in expanded:
+        if result is None:
+            continue
+        shape, shape_mins, shape_maxs = result
+        shapes.append(shape)
+        type_index.setdefault(shape.type_table[0], len(type_index))
+        mins = shape_mins if mins is None else np.minimum(mins, shape_mins)
+        maxs = shape_maxs if maxs is None else np.maximum(maxs, shape_maxs)
+
+    total = sum(len(shape) for shape in shapes)
+    coords = np.empty((total, 3), dtype=np.int32)
+    type_ids = np.empty(total, dtype=np.uint16)
+    count = 0
+    for shape in shapes:
+        n = len(shape)
+        coords[count:count + n] = shape.coords
+        # 每个图元只有一种方块，整段写入同一个类型下标
+        type_ids[count:count + n] = type_index[shape.type_table[0]]
+        count += n
+
+    return BlockBuffer(coords, type_ids, list(type_index)), (mins, maxs)
+
+def generate_columns_from_tasks(tasks):
+    """依次展开所有几何图元任务，返回合并后的 BlockBuffer。"""
+    return generate_columns_with_bbox(tasks)[0]
+
+# 方块数量达到该值时改用 Numba 单遍内核 (src/bbox_kernel.py)；导入 numba 本身需要数百毫秒，小型建筑不值得
+NUMBA_BBOX_THRESHOLD = 1000000
+_bbox_kernels = None  # None: 尚未尝试导入; False: numba 不可用
+# 带 parallel=True 的内核本身已用多个线程并行；没有 tbb 和 OpenMP 时 numba 退回 workqueue 线程层，
+# 它不允许多个线程同时调用并行内核（会直接终止进程）。本进程中并行运行的生成器和后台预热
+# 都通过这把进程级的锁依次调用 pack_coords_kernel 和 src/shape_kernels.py 中的所有内核
+_numba_parallel_lock = threading.Lock()
+
+def _get_bbox_kernels():
+    global _bbox_kernels
+    if _bbox_kernels is None:
+        try:
+            from src import bbox_kernel
+            _bbox_kernels = bbox_kernel
+        except ImportError:
+            _bbox_kernels = False
+    return _bbox_kernels
+
+def compute_bbox(blocks):
+    """
+    返回方块的边界框 (mins, maxs)，两者都是 [x, y, z] 形式的 int32 数组；没有方块时返回 (None, None)。
+    blocks 可以是方块字典列表，也可以是 BlockBuffer；在 int32 坐标数组上做向量化的 min/max 归约。
+    """
+    columns = blocks if isinstance(blocks, BlockBuffer) else blocks_to_columns(blocks)
+    if not len(columns):
+        return None, None
+    if len(columns) >= NUMBA_BBOX_THRESHOLD:
+        kernels = _get_bbox_kernels()
+        if kernels:
+            return kernels.bbox_kernel(columns.coords)
+    return columns.coords.min(axis=0), columns.coords.max(axis=0)
+
+def compute_spatial_metadata(blocks=None, bbox=None):
+    """
+    计算方块的边界框和尺寸，返回生成器写入蓝图的 spatial_metadata 字典。
+    blocks 可以是方块字典列表，也可以是 BlockBuffer；已经算好边界框 (mins, maxs) 时直接传入 bbox。
+    """
+    mins, maxs = bbox if bbox is not None else compute_bbox(blocks)
+    if mins is not None:
+        min_x, min_y, min_z = mins.tolist()
+        max_x, max_y, max_z = maxs.tolist()
+        width, height, depth = max_x - min_x + 1, max_y - min_y + 1, max_z - min_z + 1
+    else:
+        min_x, min_y, min_z, max_x, max_y, max_z = 0, 0, 0, 0, 0, 0
+        width, height, depth = 0, 0, 0
+
+    return {
+        "bounding_box": {
+            "min_x": min_x, "min_y": min_y, "min_z": min_z,
+            "max_x": max_x, "max_y": max_y, "max_z": max_z
+        },
+        "dimensions": {"width": width, "height": height, "depth": depth}
+    }
+
 
 # ==============================================================================
 #                             几何形状生成器
 # ==============================================================================
 
-def generate_blocks_from_task(task):
-    """根据任务描述调用相应的形状生成器。"""
+def generate_columns_from_task(task):
+    """根据任务描述调用相应的形状生成器，返回 BlockBuffer。"""
     # 防御性编程：确保任务是一个字典
     if not isinstance(task, dict):
         print(f"警告：在generate_blocks_from_task中跳过了一个非字典类型的任务: {task}")
-        return []
+        return BlockBuffer.empty()
 
     tool_map = {
         'cube': generate_cube,
@@ -128,7 +971,106 @@ def generate_blocks_from_task(task):
     tool_name = task.get('tool')
     if tool_name in tool_map:
         return tool_map[tool_name](**task.get('args', {}))
-    return []
+    return BlockBuffer.empty()
+
+def generate_blocks_from_task(task):
+    """根据任务描述调用相应的形状生成器，返回方块字典列表。"""
+    return columns_to_blocks(generate_columns_from_task(task))
+
+# 以下形状生成器都用 NumPy 一次性栅格化：先用 np.indices 生成局部坐标网格（球体和圆只用一维坐标广播），
+# 再用布尔掩码筛选，最后平移到 (x, y, z)，返回 BlockBuffer。坐标顺序与逐格循环的顺序一致。
+
+# 包围网格的格数达到该值时改用 Numba 内核 (src/shape_kernels.py) 栅格化球体、圆柱和拱门，
+# 省去与整个网格同样大小的临时数组；内核只接受整数参数
+NUMBA_SHAPE_THRESHOLD = 1000000
+_shape_kernels = None  # None: 尚未尝试导入; False: numba 不可用
+
+def _get_shape_kernels():
+    global _shape_kernels
+    if _shape_kernels is None:
+        try:
+            from src import shape_kernels
+            _shape_kernels = shape_kernels
+        except ImportError:
+            _shape_kernels = False
+    return _shape_kernels
+
+def warm_up_shape_kernels():
+    """提前导入并编译 Numba 内核（常驻进程启动时在后台调用）；numba 不可用时什么也不做。"""
+    kernels = _get_shape_kernels()
+    if kernels:
+        with _numba_parallel_lock:
+            kernels.warm_up()
+
+def _shape_kernel_for(cells, *int_args):
+    """网格足够大且参数都是整数时返回 Numba 内核模块，否则返回 None，由调用方走 NumPy 路径。"""
+    if cells < NUMBA_SHAPE_THRESHOLD or not all(isinstance(arg, int) for arg in int_args):
+        return None
+    return _get_shape_kernels() or None
+
+def _grid(*sizes):
+    """返回形状为 (维数, N) 的局部坐标网格，按 C 顺序（第一维最外层）展开。"""
+    return np.indices([max(int(size), 0) for size in sizes], dtype=np.int32).reshape(len(sizes), -1)
+
+def _centered(radius):
+    """返回 -radius..radius 的一维局部坐标，与 _grid(2 * radius + 1) - radius 的每一维相同。"""
+    return np.arange(max(int(2 * radius + 1), 0), dtype=np.int32) - radius
+
+# 玩家常用的几种半径会被反复请求，球体、圆盘和拱门的局部坐标按参数缓存，
+# 之后的调用只需把缓存的只读数组平移到 (x, y, z)；超过 NUMBA_SHAPE_THRESHOLD 的大型图元走内核，不缓存
+SHAPE_CACHE_SIZE = 64
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays if len(arrays) > 1 else arrays[0]
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _disk(radius, hollow):
+    """返回半径为 radius 的圆盘（或圆环）的两个只读局部坐标数组，按 C 顺序排列。"""
+    c = _centered(radius)
+    sq = c * c
+    dist_sq = sq[:, None] + sq[None, :]
+    mask = dist_sq <= radius * radius
+    if hollow:
+        mask &= dist_sq > (radius - 1) * (radius - 1)
+    i, k = np.nonzero(mask)
+    return _read_only(c[i], c[k])
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _sphere_offsets(radius, hollow):
+    """返回以原点为中心的球体（或球壳）的只读局部坐标 (N, 3)。"""
+    # 三个一维坐标广播求距离，只生成一个与网格同样大小的距离数组，不再生成三个完整的坐标网格
+    c = _centered(radius)
+    sq = c * c
+    dist_sq = sq[:, None, None] + sq[None, :, None] + sq[None, None, :]
+    mask = dist_sq <= radius * radius
+    if hollow:
+        mask &= dist_sq > (radius - 1) * (radius - 1)
+    # 由展平下标逐维取余还原坐标，比 np.nonzero 返回三个下标数组再分别索引更快
+    n = len(c)
+    flat = np.flatnonzero(mask)
+    offsets = np.empty((len(flat), 3), dtype=c.dtype)
+    offsets[:, 2] = c[flat % n]
+    flat //= n
+    offsets[:, 1] = c[flat % n]
+    offsets[:, 0] = c[flat // n]
+    return _read_only(offsets)
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _arch_offsets(radius, width):
+    """返回沿 z 方向延伸 width 格的半圆拱的只读局部坐标 (N, 3)。"""
+    k, i, j = _grid(width, 2 * radius + 1, radius + 1)
+    i = i - radius
+    # Equation for a semicircle
+    mask = np.abs(i * i + j * j - radius * radius) < radius
+    return _read_only(np.stack((i[mask], j[mask], k[mask]), axis=1))
+
+def _translated(offsets, x, y, z):
+    """把局部坐标平移到 (x, y, z)，一次写入新的 int32 数组；与逐列赋值相同，非整数结果向零取整。"""
+    coords = np.empty(offsets.shape, dtype=np.int32)
+    np.add(offsets, (x, y, z), out=coords, casting='unsafe')
+    return coords
 
 def generate_cube(hollow=False, **kwargs):
     x = kwargs.get('x', 0)
@@ -138,15 +1080,24 @@ def generate_cube(hollow=False, **kwargs):
     size_y = kwargs.get('size_y', 1)
     size_z = kwargs.get('size_z', 1)
     block_type = kwargs.get('block_type', 'stone')
-    
-    blocks = []
-    for i in range(size_x):
-        for j in range(size_y):
-            for k in range(size_z):
-                is_shell = (i == 0 or i == size_x - 1 or j == 0 or j == size_y - 1 or k == 0 or k == size_z - 1)
-                if not hollow or is_shell:
-                    blocks.append({'x': x + i, 'y': y + j, 'z': z + k, 'block_type': block_type})
-    return blocks
+
+    if not hollow:
+        i, j, k = _grid(size_x, size_y, size_z)
+        return BlockBuffer.from_coords(np.stack((x + i, y + j, z + k), axis=1), block_type)
+
+    # 外壳掩码由三个一维的"是否在边上"数组广播求或得到，不生成三个完整的坐标网格
+    axes = [np.arange(max(int(size), 0), dtype=np.int32) for size in (size_x, size_y, size_z)]
+    ei, ej, ek = [(a == 0) | (a == size - 1) for a, size in zip(axes, (size_x, size_y, size_z))]
+    shell = ei[:, None, None] | ej[None, :, None] | ek[None, None, :]
+    # 与球体相同，由展平下标逐维还原坐标
+    ny, nz = len(axes[1]), len(axes[2])
+    flat = np.flatnonzero(shell)
+    coords = np.empty((len(flat), 3), dtype=np.int32)
+    coords[:, 2] = z + flat % nz
+    flat //= nz
+    coords[:, 1] = y + flat % ny
+    coords[:, 0] = x + flat // ny
+    return BlockBuffer(coords, np.zeros(len(coords), dtype=np.uint16), [block_type])
 
 def generate_line(**kwargs):
     x1 = kwargs.get('x1', 0)
@@ -157,20 +1108,26 @@ def generate_line(**kwargs):
     z2 = kwargs.get('z2', 0)
     block_type = kwargs.get('block_type', 'stone')
 
-    blocks = []
     dx, dy, dz = x2 - x1, y2 - y1, z2 - z1
     steps = max(abs(dx), abs(dy), abs(dz))
     if steps == 0:
-        return [{'x': x1, 'y': y1, 'z': z1, 'block_type': block_type}]
-    
-    x_inc, y_inc, z_inc = dx / steps, dy / steps, dz / steps
-    x, y, z = float(x1), float(y1), float(z1)
-    for _ in range(int(steps) + 1):
-        blocks.append({'x': round(x), 'y': round(y), 'z': round(z), 'block_type': block_type})
-        x += x_inc
-        y += y_inc
-        z += z_inc
-    return blocks
+        return BlockBuffer.from_coords([(x1, y1, z1)], block_type)
+
+    count = int(steps) + 1
+    if all(isinstance(v, int) for v in (x1, y1, z1, dx, dy, dz)) and all(d in (0, steps, -steps) for d in (dx, dy, dz)):
+        # 沿坐标轴或 45° 对角线的直线（建筑中最常见）每步在各轴上恰好前进 0 或 ±1 格，直接用整数算出，不经过浮点
+        t = np.arange(count, dtype=np.int32)
+        coords = np.empty((count, 3), dtype=np.int32)
+        coords[:, 0] = x1 + t * (dx // steps)
+        coords[:, 1] = y1 + t * (dy // steps)
+        coords[:, 2] = z1 + t * (dz // steps)
+        return BlockBuffer(coords, np.zeros(count, dtype=np.uint16), [block_type])
+
+    # 其余直线逐步累加增量（与逐点累加的浮点结果一致），再按四舍六入五成双取整，与内置 round 相同
+    increments = np.empty((count, 3), dtype=np.float64)
+    increments[0] = (x1, y1, z1)
+    increments[1:] = (dx / steps, dy / steps, dz / steps)
+    return BlockBuffer.from_coords(np.round(np.cumsum(increments, axis=0)), block_type)
 
 def generate_sphere(hollow=False, **kwargs):
     x = kwargs.get('x', 0)
@@ -179,18 +1136,14 @@ def generate_sphere(hollow=False, **kwargs):
     radius = kwargs.get('radius', 5)
     block_type = kwargs.get('block_type', 'stone')
 
-    blocks = []
-    r_sq = radius * radius
-    inner_r_sq = (radius - 1) * (radius - 1)
+    kernels = _shape_kernel_for((2 * radius + 1) ** 3, radius)
+    if kernels:
+        with _numba_parallel_lock:
+            local = kernels.sphere_kernel(radius, hollow)
+        return BlockBuffer.from_coords(local + np.array((x, y, z)), block_type)
 
-    for i in range(-radius, radius + 1):
-        for j in range(-radius, radius + 1):
-            for k in range(-radius, radius + 1):
-                dist_sq = i*i + j*j + k*k
-                if dist_sq <= r_sq:
-                    if not hollow or dist_sq > inner_r_sq:
-                        blocks.append({'x': x + i, 'y': y + j, 'z': z + k, 'block_type': block_type})
-    return blocks
+    coords = _translated(_sphere_offsets(radius, hollow), x, y, z)
+    return BlockBuffer(coords, np.zeros(len(coords), dtype=np.uint16), [block_type])
 
 def generate_cylinder(hollow=False, **kwargs):
     x = kwargs.get('x', 0)
@@ -200,17 +1153,20 @@ def generate_cylinder(hollow=False, **kwargs):
     height = kwargs.get('height', 10)
     block_type = kwargs.get('block_type', 'stone')
 
-    blocks = []
-    r_sq = radius * radius
-    inner_r_sq = (radius - 1) * (radius - 1)
-    for j in range(height):
-        for i in range(-radius, radius + 1):
-            for k in range(-radius, radius + 1):
-                dist_sq = i*i + k*k
-                if dist_sq <= r_sq:
-                    if not hollow or dist_sq > inner_r_sq:
-                        blocks.append({'x': x + i, 'y': y + j, 'z': z + k, 'block_type': block_type})
-    return blocks
+    kernels = _shape_kernel_for(height * (2 * radius + 1) ** 2, radius, height)
+    if kernels:
+        with _numba_parallel_lock:
+            local = kernels.cylinder_kernel(radius, height, hollow)
+        return BlockBuffer.from_coords(local + np.array((x, y, z)), block_type)
+
+    # 圆盘只计算一次，再逐层平铺
+    i, k = _disk(radius, hollow)
+    layers = max(int(height), 0)
+    coords = np.empty((layers * len(i), 3), dtype=np.int32)
+    coords[:, 0] = np.tile(x + i, layers)
+    coords[:, 1] = np.repeat(y + np.arange(layers), len(i))
+    coords[:, 2] = np.tile(z + k, layers)
+    return BlockBuffer(coords, np.zeros(len(coords), dtype=np.uint16), [block_type])
 
 def generate_pyramid(**kwargs):
     x = kwargs.get('x', 0)
@@ -219,16 +1175,20 @@ def generate_pyramid(**kwargs):
     base_size = kwargs.get('base_size', 10)
     block_type = kwargs.get('block_type', 'sandstone')
 
-    blocks = []
-    height = (base_size + 1) // 2
-    for j in range(height):
-        layer_size = base_size - 2 * j
-        if layer_size <= 0: break
-        offset = j
-        for i in range(layer_size):
-            for k in range(layer_size):
-                blocks.append({'x': x + i + offset, 'y': y + j, 'z': z + k + offset, 'block_type': block_type})
-    return blocks
+    # 第 j 层是边长 base_size - 2j、向内缩进 j 格的正方形；所有层一次算出：
+    # 先按每层方块数把层号重复展开，再由层内序号求出行列
+    j = np.arange(max((base_size + 1) // 2, 0), dtype=np.int64)
+    sizes = base_size - 2 * j
+    j, sizes = j[sizes > 0], sizes[sizes > 0]
+    if not len(j):
+        return BlockBuffer.empty()
+    counts = sizes * sizes
+    starts = np.cumsum(counts) - counts
+    layer = np.repeat(j, counts)
+    size = np.repeat(sizes, counts)
+    t = np.arange(counts.sum()) - np.repeat(starts, counts)
+    coords = np.stack((x + t // size + layer, y + layer, z + t % size + layer), axis=1)
+    return BlockBuffer.from_coords(coords, block_type)
 
 def generate_circle(hollow=False, **kwargs):
     x = kwargs.get('x', 0)
@@ -237,16 +1197,8 @@ def generate_circle(hollow=False, **kwargs):
     radius = kwargs.get('radius', 5)
     block_type = kwargs.get('block_type', 'stone')
 
-    blocks = []
-    r_sq = radius * radius
-    inner_r_sq = (radius - 1) * (radius - 1)
-    for i in range(-radius, radius + 1):
-        for k in range(-radius, radius + 1):
-            dist_sq = i*i + k*k
-            if dist_sq <= r_sq:
-                if not hollow or dist_sq > inner_r_sq:
-                    blocks.append({'x': x + i, 'y': y, 'z': z + k, 'block_type': block_type})
-    return blocks
+    i, k = _disk(radius, hollow)
+    return BlockBuffer.from_coords(np.stack((x + i, np.full_like(i, y), z + k), axis=1), block_type)
 
 def generate_arch(**kwargs):
     x = kwargs.get('x', 0)
@@ -256,11 +1208,10 @@ def generate_arch(**kwargs):
     width = kwargs.get('width', 3)
     block_type = kwargs.get('block_type', 'stone_bricks')
 
-    blocks = []
-    for k in range(width):
-        for i in range(-radius, radius + 1):
-            for j in range(radius + 1):
-                # Equation for a semicircle
-                if abs(i*i + j*j - radius*radius) < radius:
-                    blocks.append({'x': x + i, 'y': y + j, 'z': z + k, 'block_type': block_type})
-    return blocks
+    kernels = _shape_kernel_for(width * (2 * radius + 1) * (radius + 1), radius, width)
+    if kernels:
+        with _numba_parallel_lock:
+            local = kernels.arch_kernel(radius, width)
+        return BlockBuffer.from_coords(local + np.array((x, y, z)), block_type)
+
+    return BlockBuffer.from_coords(_translated(_arch_offsets(radius, width), x, y, z), block_type)
@@ -11,42 +11,8 @@ sys.path.append(os.path.join(current_dir, '..'))
 from src.util import get_llm_client, get_llm_response, read_json_file, write_json_file
 from src.key_manager import get_next_api_key # Added this import
 
-def main():
-    parser = argparse.ArgumentParser(description="监理师：整合所有建筑部件并生成最终建造规划。")
-    parser.add_argument("--prompt", type=str, required=True, help="玩家的原始建筑指令。")
-
-    args = parser.parse_args()
-
-    print("监理师已启动...正在检查 build 目录。")
-
-    build_dir = os.path.join(current_dir, '../build')
-    if not os.path.exists(build_dir) or not os.listdir(build_dir):
-        print("监理师：build 目录为空，无需执行。")
-        return
-
-    # 1. 读取所有生成的JSON文件
-    build_components = []
-    component_files = [f for f in os.listdir(build_dir) if f.endswith('.json')]
-    for file_name in component_files:
-        file_path = os.path.join(build_dir, file_name)
-        component_data = read_json_file(file_path)
-        if component_data:
-            # 包含完整的 component_data，其中应包含 generated_structure 和 spatial_metadata
-            build_components.append({
-                "file_name": file_name,
-                "description": component_data.get("description"),
-                "generated_structure": component_data.get("generated_structure", {}),
-                "blocks_count": len(component_data.get("blocks", []))
-            })
-
-    if not build_components:
-        print("监理师：未能从 build 目录加载任何建筑组件。")
-        return
-
-    print(f"监理师：找到了 {len(build_components)} 个建筑组件。")
-
-    # 2. 构建发送给LLM的提示
-    system_prompt = """你是一个顶级的《我的世界》建筑结构总工程师。你的核心任务是解决一个复杂的3D空间布局问题：将一系列独立的建筑组件，根据玩家的意图，组合成一个结构合理、无缝连接的宏伟建筑。
+# 固定的 system prompt：每次请求的前缀完全相同，便于服务端复用提示缓存
+SYSTEM_PROMPT = """你是一个顶级的《我的世界》建筑结构总工程师。你的核心任务是解决一个复杂的3D空间布局问题：将一系列独立的建筑组件，根据玩家的意图，组合成一个结构合理、无缝连接的宏伟建筑。
 
 **首要原则：绝不允许组件重叠！**
 
@@ -86,6 +52,41 @@ def main():
 请严格遵守此流程，进行精确的计算，确保建筑的完美组装。
 """
 
+def main():
+    parser = argparse.ArgumentParser(description="监理师：整合所有建筑部件并生成最终建造规划。")
+    parser.add_argument("--prompt", type=str, required=True, help="玩家的原始建筑指令。")
+
+    args = parser.parse_args()
+
+    print("监理师已启动...正在检查 build 目录。")
+
+    build_dir = os.path.join(current_dir, '../build')
+    if not os.path.exists(build_dir) or not os.listdir(build_dir):
+        print("监理师：build 目录为空，无需执行。")
+        return
+
+    # 1. 读取所有生成的JSON文件
+    build_components = []
+    component_files = [f for f in os.listdir(build_dir) if f.endswith('.json')]
+    for file_name in component_files:
+        file_path = os.path.join(build_dir, file_name)
+        component_data = read_json_file(file_path)
+        if component_data:
+            # 包含完整的 component_data，其中应包含 generated_structure 和 spatial_metadata
+            build_components.append({
+                "file_name": file_name,
+                "description": component_data.get("description"),
+                "generated_structure": component_data.get("generated_structure", {}),
+                "blocks_count": len(component_data.get("blocks", []))
+            })
+
+    if not build_components:
+        print("监理师：未能从 build 目录加载任何建筑组件。")
+        return
+
+    print(f"监理师：找到了 {len(build_components)} 个建筑组件。")
+
+    # 2. 构建发送给LLM的提示（system prompt 为固定的 SYSTEM_PROMPT）
     user_prompt_data = {
         "original_prompt": args.prompt,
         "components": build_components
@@ -98,7 +99,7 @@ def main():
     try:
         api_key = get_next_api_key()
         client = get_llm_client(api_key)
-        success, final_plan = get_llm_response(client, system_prompt, user_prompt)
+        success, final_plan = get_llm_response(client, SYSTEM_PROMPT, user_prompt)
 
         if not success:
             print(f"监理师：大模型规划失败: {final_plan}")
@@ -0,0 +1,75 @@
+# tests/test_llm_cache.py
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import llm_cache
+from src.llm_cache import GenerativeCache
+
+NEAR_MISSES = [
+    ("red roof", "blue roof"),
+    ("moat", "wall"),
+    ("nether portal", "end portal"),
+    ("house", "horse"),
+]
+
+class _FakeModel:
+    """把每个词映射到固定方向的词袋向量：同样的词组成的描述完全相同，换一个词就明显不同。"""
+    def __init__(self, name):
+        self.vocab = {}
+
+    def encode(self, text, normalize_embeddings=True):
+        vector = np.zeros(64, dtype=np.float32)
+        for word in text.lower().split():
+            vector[self.vocab.setdefault(word, len(self.vocab))] += 1.0
+        return vector / np.linalg.norm(vector)
+
+class GenerativeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_exact_hit_without_model(self):
+        with mock.patch.object(llm_cache, 'SentenceTransformer', None):
+            cache = GenerativeCache(self.path)
+            cache.store('partition', 'red roof', {'design': 'red'})
+            self.assertEqual(cache.lookup('partition', 'red roof'), (True, {'design': 'red'}))
+
+    def test_near_misses_do_not_hit_without_model(self):
+        with mock.patch.object(llm_cache, 'SentenceTransformer', None):
+            cache = GenerativeCache(self.path)
+            self.assertFalse(cache.semantic_available)
+            for stored, asked in NEAR_MISSES:
+                cache.store('partition', stored, {'design': stored})
+                self.assertEqual(cache.lookup('partition', asked, semantic=True), (False, None), (stored, asked))
+
+    def test_failed_model_load_falls_back_to_exact(self):
+        def broken(name):
+            raise OSError("no network")
+        with mock.patch.object(llm_cache, 'SentenceTransformer', broken):
+            cache = GenerativeCache(self.path)
+            cache.store('partition', 'nether portal', {'design': 'nether'})
+            self.assertEqual(cache.lookup('partition', 'end portal'), (False, None))
+            self.assertTrue(cache.lookup('partition', 'nether portal')[0])
+
+    def test_semantic_lookup_with_model(self):
+        with mock.patch.object(llm_cache, 'SentenceTransformer', _FakeModel):
+            cache = GenerativeCache(self.path)
+            cache.store('partition', 'nether portal', {'design': 'nether'})
+            self.assertEqual(cache.lookup('partition', '  Nether   portal'), (True, {'design': 'nether'}))
+            self.assertEqual(cache.lookup('partition', 'end portal'), (False, None))
+            # semantic=False 写入的条目没有向量，只能精确命中
+            cache.store('partition', 'stone wall', {'design': 'wall'}, semantic=False)
+            self.assertEqual(cache.lookup('partition', 'Stone wall'), (False, None))
+
+if __name__ == '__main__':
+    unittest.main()
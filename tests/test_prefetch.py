@@ -0,0 +1,54 @@
+# tests/test_prefetch.py
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import llm_cache, util
+from src.llm_cache import GenerativeCache
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(llm_cache, 'SentenceTransformer', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = GenerativeCache(os.path.join(self.tmp.name, 'cache.sqlite'))
+        for name, value in (('_llm_cache', self.cache), ('_prefetch_enabled', False)):
+            patcher = mock.patch.object(util, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = []
+        patcher = mock.patch.object(util, 'get_llm_response', self._fake_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _fake_llm(self, client, system_prompt, user_prompt, expect_json=True, **kwargs):
+        self.calls.append(user_prompt)
+        return True, {"design": user_prompt}
+
+    def test_prefetch_disabled_outside_resident_processes(self):
+        self.assertEqual(util.prefetch_llm_responses(None, [("system", "a yard")]), [])
+        self.assertEqual(self.calls, [])
+
+    def test_prefetched_response_is_stored(self):
+        util.enable_prefetch()
+        threads = util.prefetch_llm_responses(None, [("system", "a yard around a portal")])
+        self.assertEqual(len(threads), 1)
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(self.calls, ["a yard around a portal"])
+
+        # 之后原样发出的请求直接命中预取写入的条目，不再请求LLM
+        response = util.get_cached_llm_response(None, "system", "a yard around a portal", semantic=False)
+        self.assertEqual(response, (True, {"design": "a yard around a portal"}))
+        self.assertEqual(len(self.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()